@@ -14,9 +14,8 @@ class AI:
         except Exception as e:
             logger.write(f"Error initializing AI: {str(e)}", is_exception=True)
 
-    def process_input(self, input):
-        try:
-            prompt = f"""
+    def _build_prompt(self, input):
+        return f"""
             Analyze the following vehicle data and create an extensive, detailed 5000 wordreport:
 
             {input}
@@ -48,12 +47,30 @@ class AI:
 
             The report should be extensive, utilizing all provided data points to paint a complete picture of the vehicle. Aim for a thorough, multi-paragraph report that a potential buyer or vehicle inspector would find informative and comprehensive.
             """
-            
-            response = self.model.generate_content(prompt)
+
+    def process_input(self, input, timeout=None):
+        try:
+            prompt = self._build_prompt(input)
+            response = self.model.generate_content(prompt, request_options=_request_options(timeout))
             return response.text
         except Exception as e:
             logger.write(f"Error processing input: {str(e)}", is_exception=True)
 
+    def stream_input(self, input, timeout=None):
+        # Yields the report chunk by chunk as Gemini generates it; raises if the stream
+        # fails partway, so callers can tell a cut-off report from a finished one
+        try:
+            response = self.model.generate_content(self._build_prompt(input), stream=True, request_options=_request_options(timeout))
+            for chunk in response:
+                yield chunk.text
+        except Exception as e:
+            logger.write(f"Error streaming input: {str(e)}", is_exception=True)
+            raise
+
+def _request_options(timeout):
+    # Bounds the Gemini request; a falsy timeout leaves it unlimited
+    return {'timeout': timeout} if timeout else None
+
 if __name__ == "__main__":
     try:
         ai = AI()
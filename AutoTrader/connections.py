@@ -9,18 +9,12 @@ from dotenv import load_dotenv
 # Load environment variables from .env file in the parent directory
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
+REQUEST_TIMEOUT = 10
+
 class AutoTraderAPI:
     def __init__(self):
         self.base_url = "https://www.autotrader.co.uk"
         
-        # Print environment variables
-        print("USER_AGENT:", os.getenv("USER_AGENT"))
-        print("SAURON_APP_VERSION:", os.getenv("SAURON_APP_VERSION"))
-        print("SP_ID:", os.getenv("SP_ID"))
-        print("AB_TEST_GROUPS:", os.getenv("AB_TEST_GROUPS"))
-        print("POSTCODE:", os.getenv("POSTCODE"))
-        print("SP:", os.getenv("SP"))
-        
         self.headers = {
             "Accept": "*/*",
             "Accept-Encoding": "gzip, deflate, br",
@@ -48,8 +42,7 @@ class AutoTraderAPI:
         }
 
     def _make_request(self, url, payload):
-        print(self.headers)
-        response = requests.post(url, headers=self.headers, cookies=self.cookies, json=payload)
+        response = requests.post(url, headers=self.headers, cookies=self.cookies, json=payload, timeout=REQUEST_TIMEOUT)
 
 
         response.raise_for_status()
@@ -91,12 +84,9 @@ class AutoTraderAPI:
         }}
         """
         
-        print("MAKING QUERY")
         schema_payload = [{"query": schema_query}]
         schema_data = self._make_request(f"{self.base_url}/at-graphql?opname=SchemaQuery", schema_payload)
 
-        print(schema_data)
-        
         return schema_data[0]['data']['__type']['fields']
 
     def _get_full_query(self, type_name):
@@ -124,8 +114,6 @@ class AutoTraderAPI:
         
         fields = schema_data[0]['data']['__type']['fields']
         query_fields = self._generate_query_fields(fields)
-        print(query_fields)
-        
         return query_fields
 
     def search_listings(self, make, model, min_year=None, max_year=None, sample_size=100):
@@ -1,5 +1,6 @@
 from .connections import AutoTraderAPI
 from Utils.utils import flatten_dict
+from Utils.pipeline import Source, DAY
 
 def get_autotrader_listings(vehicle_data):
     # Initialize the AutoTrader API client
@@ -28,5 +29,25 @@ def get_autotrader_listings(vehicle_data):
     # Return the flattened data dictionary
     return flattened_data
 
+def get_autotrader_market(make, model, year, client=None):
+    # Samples current listings for the same make, model and year and summarises them
+    autotrader_api = client or AutoTraderAPI()
+    listings = autotrader_api.search_listings(make, model, min_year=year, max_year=year)
+    stats = autotrader_api.get_listing_stats(listings)
+
+    return flatten_dict({'autotrader': stats})
+
+# Listing sampling pages through search results, so it only runs in the full profile
+SOURCE = Source(
+    'autotrader',
+    get_autotrader_market,
+    inputs=('make', 'model', 'year'),
+    client=AutoTraderAPI,
+    ttl=DAY,
+    timeout=30,
+    cost=8,
+    latency=15,
+)
+
 # Specify which functions should be importable when using "from AutoTrader import *"
-__all__ = ['get_autotrader_listings']
\ No newline at end of file
+__all__ = ['get_autotrader_listings', 'get_autotrader_market']
\ No newline at end of file
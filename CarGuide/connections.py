@@ -1,16 +1,20 @@
 import json
 from curl_cffi import requests
+from Utils.sessions import ThreadLocalSession
+
+REQUEST_TIMEOUT = 10
 
 class CarLookup:
     BASE_URL = "https://ya6349wsii.execute-api.eu-west-2.amazonaws.com/prod/lookup"
 
-    def __init__(self, vrm):
+    def __init__(self, vrm=None):
         self.vrm = vrm
+        self.sessions = ThreadLocalSession(requests.Session)
 
-    def get_car_details(self):
+    def get_car_details(self, vrm=None):
         try:
-            url = f"{self.BASE_URL}?vrm={self.vrm}"
-            response = requests.get(url)
+            url = f"{self.BASE_URL}?vrm={vrm or self.vrm}"
+            response = self.sessions.get().get(url, timeout=REQUEST_TIMEOUT)
             
             if response.status_code == 200:
                 data = json.loads(response.text)
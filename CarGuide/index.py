@@ -1,14 +1,28 @@
 from .connections import CarLookup
 from datetime import datetime, timezone
 from Utils.utils import flatten_dict
+from Utils.pipeline import Source, DAY
+from Utils.vrm import normalise_vrm
 
-def get_car_details(vrm):
-    car_lookup = CarLookup(vrm)
-    car_details = car_lookup.get_car_details()
+def get_car_details(vrm, client=None):
+    vrm = normalise_vrm(vrm)
+    car_lookup = client or CarLookup()
+    car_details = car_lookup.get_car_details(vrm)
     
     vehicle_data = flatten_dict(car_details)
 
     return vehicle_data
 
+SOURCE = Source(
+    'carguide',
+    get_car_details,
+    inputs=('vrm',),
+    outputs={'make': 'basicDetails_make', 'model': 'basicDetails_model'},
+    client=CarLookup,
+    ttl=DAY,
+    cost=1,
+    latency=0.5,
+)
+
 # Make sure to export the function
 __all__ = ['get_car_details']
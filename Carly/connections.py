@@ -4,6 +4,9 @@ from curl_cffi import requests
 from bs4 import BeautifulSoup
 import re
 from dotenv import load_dotenv
+from Utils.sessions import ThreadLocalSession
+
+REQUEST_TIMEOUT = 10
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -12,48 +15,52 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 class CarlyVehicleHistory:
     def __init__(self):
         self.base_url = "https://vin.mycarly.io"
+        self.api_headers = {
+            'Accept': 'application/json, text/plain, */*',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Language': 'en-GB,en;q=0.9',
+            'carly-user-country': 'GB',
+            'carly-user-id': os.getenv('CARLY_USER_ID'),
+            'carly-user-lang': 'en',
+            'Connection': 'keep-alive',
+            'Host': 'vin.mycarly.io',
+            'Origin': 'https://www.mycarly.com',
+            'Referer': 'https://www.mycarly.com/',
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'cross-site',
+            'User-Agent': os.getenv('USER_AGENT')
+        }
+        self.page_headers = {
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Language': 'en-GB,en;q=0.9',
+            'Connection': 'keep-alive',
+            'Host': 'vin.mycarly.io',
+            'User-Agent': os.getenv('USER_AGENT')
+        }
+        self.mixpanel_user_id = os.getenv('MIXPANEL_USER_ID')
+        self.sessions = ThreadLocalSession(requests.Session)
 
     def get_vehicle_info(self, vrm):
+        session = self.sessions.get()
+
         def get_history_url(vrm):
             url = f"{self.base_url}/vehicle-history"
             params = {
                 'vrm': vrm,
                 'locale': 'en-GB',
                 'application_type': 'production',
-                'mixpanel_user_id': os.getenv('MIXPANEL_USER_ID')
+                'mixpanel_user_id': self.mixpanel_user_id
             }
-            headers = {
-                'Accept': 'application/json, text/plain, */*',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept-Language': 'en-GB,en;q=0.9',
-                'carly-user-country': 'GB',
-                'carly-user-id': os.getenv('CARLY_USER_ID'),
-                'carly-user-lang': 'en',
-                'Connection': 'keep-alive',
-                'Host': 'vin.mycarly.io',
-                'Origin': 'https://www.mycarly.com',
-                'Referer': 'https://www.mycarly.com/',
-                'Sec-Fetch-Dest': 'empty',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Site': 'cross-site',
-                'User-Agent': os.getenv('USER_AGENT')
-            }
-            response = requests.get(url, params=params, headers=headers)
+            response = session.get(url, params=params, headers=self.api_headers, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             return data['data']['url']
 
         history_url = get_history_url(vrm)
         
-        headers = {
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Accept-Language': 'en-GB,en;q=0.9',
-            'Connection': 'keep-alive',
-            'Host': 'vin.mycarly.io',
-            'User-Agent': os.getenv('USER_AGENT')
-        }
-        response = requests.get(history_url, headers=headers)
+        response = session.get(history_url, headers=self.page_headers, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, 'html.parser')
 
@@ -1,12 +1,21 @@
 from .connections import CarlyVehicleHistory as CarlyAPI
 from Utils.utils import flatten_dict
 from Utils.logging import logger
+from Utils.pipeline import Source, HOUR
+from Utils.singleflight import SingleFlight
+from Utils.vrm import normalise_vrm
 
-def get_carly_vehicle_history(vrm):
+# Both Carly sources read the same page; when they run together they share one fetch
+_pages = SingleFlight()
+
+def _vehicle_info(carly_api, vrm):
+    return _pages.do(vrm, carly_api.get_vehicle_info, vrm)
+
+def get_carly_vehicle_history(vrm, client=None):
+    vrm = normalise_vrm(vrm)
     try:
-        carly_api = CarlyAPI()
-        carly_data = carly_api.get_vehicle_history(vrm)
-        carly_data = carly_api.extract_vehicle_info(carly_data, vrm)
+        carly_api = client or CarlyAPI()
+        carly_data = _vehicle_info(carly_api, vrm)
         
         # Flatten the carly_data dictionary
         flattened_data = flatten_dict(carly_data)
@@ -14,6 +23,39 @@ def get_carly_vehicle_history(vrm):
         return flattened_data
     except Exception as e:
         logger.write(f"Error in get_carly_vehicle_history for VRM {vrm}: {str(e)}", is_exception=True)
-        
 
-__all__ = ['get_carly_vehicle_history']
\ No newline at end of file
+def get_carly_theft_status(vrm, client=None):
+    vrm = normalise_vrm(vrm)
+    try:
+        carly_api = client or CarlyAPI()
+        carly_data = _vehicle_info(carly_api, vrm)
+        return {'theft': carly_data.get('theft'), 'damages': carly_data.get('damages', [])}
+    except Exception as e:
+        logger.write(f"Error in get_carly_theft_status for VRM {vrm}: {str(e)}", is_exception=True)
+
+# VIN and build specs never change, so a stored result never expires.
+# Two round trips and an HTML scrape put it above the JSON sources in cost.
+SOURCE = Source(
+    'carly',
+    get_carly_vehicle_history,
+    inputs=('vrm',),
+    outputs={'vin': 'vin', 'make': 'brandName', 'model': 'model'},
+    client=CarlyAPI,
+    cost=3,
+    latency=3,
+)
+
+# Theft and damage records can change at any time, so they are refetched hourly on their own
+THEFT_SOURCE = Source(
+    'carly_theft',
+    get_carly_theft_status,
+    inputs=('vrm',),
+    client=CarlyAPI,
+    ttl=HOUR,
+    cost=3,
+    latency=3,
+)
+
+SOURCES = (SOURCE, THEFT_SOURCE)
+
+__all__ = ['get_carly_vehicle_history', 'get_carly_theft_status']
\ No newline at end of file
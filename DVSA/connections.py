@@ -1,8 +1,13 @@
 import requests
 import json
+import time
+import threading
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from Utils.sessions import ThreadLocalSession
+
+REQUEST_TIMEOUT = 10
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -15,8 +20,20 @@ class MOTHistoryRetriever:
         self.api_key = os.getenv('DVSA_API_KEY')
         self.token_url = os.getenv('DVSA_TOKEN_URL')
         self.api_base_url = os.getenv('DVSA_API_BASE_URL')
+        self.sessions = ThreadLocalSession(requests.Session)
+        self.token_lock = threading.Lock()
+        self.access_token = None
+        self.token_expires_at = 0
 
     def get_access_token(self):
+        # Reuse the token until shortly before it expires instead of fetching one per lookup
+        with self.token_lock:
+            if self.access_token is None or time.monotonic() >= self.token_expires_at:
+                self.access_token, expires_in = self._request_access_token()
+                self.token_expires_at = time.monotonic() + max(expires_in - 60, 0)
+            return self.access_token
+
+    def _request_access_token(self):
         # Request an access token using client credentials
         token_data = {
             'grant_type': 'client_credentials',
@@ -24,10 +41,11 @@ class MOTHistoryRetriever:
             'client_secret': self.client_secret,
             'scope': 'https://tapi.dvsa.gov.uk/.default'
         }
-        response = requests.post(self.token_url, data=token_data)
+        response = self.sessions.get().post(self.token_url, data=token_data, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
-            return response.json().get('access_token')
-        return None
+            token = response.json()
+            return token.get('access_token'), int(token.get('expires_in', 0))
+        return None, 0
     
     def fetch_mot_history(self, registration):
         # Fetch MOT history for a given vehicle registration
@@ -42,7 +60,7 @@ class MOTHistoryRetriever:
             'Content-Type': 'application/json',
             'Accept': 'application/json'
         }
-        response = requests.get(url, headers=headers)
+        response = self.sessions.get().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         else:
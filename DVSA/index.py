@@ -4,14 +4,29 @@ from datetime import datetime
 import os
 import json
 from Utils.logging import logger
+from Utils.pipeline import Source, DAY
+from Utils.vrm import normalise_vrm
 
-def get_mot_history(vrm):
+def get_mot_history(vrm, client=None):
+    vrm = normalise_vrm(vrm)
     try:
-        dvsa_api = DVSAAPI()
+        dvsa_api = client or DVSAAPI()
         mot_history = dvsa_api.fetch_mot_history(vrm)
 
         return mot_history
     except Exception as e:
         logger.write(str(e), is_exception=True)
 
+# MOT history is kept whole under its own key and refreshed daily
+SOURCE = Source(
+    'dvsa',
+    get_mot_history,
+    inputs=('vrm',),
+    client=DVSAAPI,
+    key='mot_history',
+    ttl=DAY,
+    cost=1,
+    latency=1,
+)
+
 __all__ = ['get_mot_history']
\ No newline at end of file
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 from typing import Dict, Optional, List, Tuple
 from datetime import datetime, timedelta
 
+REQUEST_TIMEOUT = 10
+
 class EbayBrowseApiConsumer:
     BASE_URL = "https://api.ebay.com/buy/browse/v2"
     
@@ -50,7 +52,7 @@ class EbayBrowseApiConsumer:
             params["filter"] = ",".join(filters)
 
         # Make API request and handle response
-        response = requests.get(url, headers=self.headers, params=params)
+        response = requests.get(url, headers=self.headers, params=params, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         else:
@@ -58,7 +60,7 @@ class EbayBrowseApiConsumer:
 
     def get_item_details(self, item_id: str) -> Dict:
         url = f"{self.BASE_URL}/item/{item_id}"
-        response = requests.get(url, headers=self.headers)
+        response = requests.get(url, headers=self.headers, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         else:
@@ -0,0 +1,30 @@
+from .connections import EbayBrowseApiConsumer, search_vehicles
+from Utils.utils import flatten_dict
+from Utils.logging import logger
+from Utils.pipeline import Source, DAY
+
+def get_ebay_listings(make, model, year, client=None):
+    try:
+        ebay_api = client or EbayBrowseApiConsumer()
+        vehicles = search_vehicles(ebay_api, make, model, year)
+        lowest_price, highest_price = ebay_api.get_price_range({"itemSummaries": vehicles})
+
+        return flatten_dict({'ebay': {
+            'listings': len(vehicles),
+            'price': {'min': lowest_price, 'max': highest_price},
+        }})
+    except Exception as e:
+        logger.write(f"Error in get_ebay_listings for {make} {model} {year}: {str(e)}", is_exception=True)
+
+# Market sampling, so it only runs in the full profile; needs EBAY_OAUTH_TOKEN
+SOURCE = Source(
+    'ebay',
+    get_ebay_listings,
+    inputs=('make', 'model', 'year'),
+    client=EbayBrowseApiConsumer,
+    ttl=DAY,
+    cost=5,
+    latency=2,
+)
+
+__all__ = ['get_ebay_listings']
@@ -0,0 +1,224 @@
+from dataclasses import asdict
+from datetime import datetime, timezone
+from Models.vehicle import (
+    VehicleDataModel, VehicleInfo, EngineSpecs, TransmissionSpecs, PerformanceSpecs,
+    DimensionSpecs, ChassisSpecs, FuelSpecs, VehicleSpecifications, RegistrationInfo,
+    VehicleStatus, VehicleScore, MOTTest, MarketData,
+)
+
+def _text(value):
+    text = str(value).strip()
+    return text or None
+
+def _int(value):
+    if isinstance(value, bool):
+        return None
+    return int(float(str(value).replace(',', '')))
+
+def _float(value):
+    if isinstance(value, bool):
+        return None
+    return float(str(value).replace(',', ''))
+
+def _bool(value):
+    return value if isinstance(value, bool) else None
+
+def _flag(value):
+    # Any record against the vehicle, such as a theft report, counts as set
+    return bool(value)
+
+def _timestamp(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    text = str(value).strip().rstrip('Z')
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y.%m.%d %H:%M:%S', '%Y.%m.%d', '%Y-%m-%d', '%Y-%m'):
+        try:
+            return int(datetime.strptime(text, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    return None
+
+def _equals(expected):
+    return lambda value: str(value).strip().lower() == expected
+
+# field: (converter, source keys in order of precedence)
+# CarGuide (basicDetails_*, provenance_*) is preferred for registration data,
+# Carly (plain and "Title case" keys) for build specs, VehicleScore (pageProps_*) fills the gaps.
+VEHICLE_INFO = {
+    'make': (_text, 'basicDetails_make', 'pageProps_vehicle_make', 'brandName'),
+    'model': (_text, 'basicDetails_model', 'pageProps_vehicle_model', 'model'),
+    'year': (_int, 'pageProps_vehicle_year'),
+    'series_description': (_text, 'Series description', 'Model variant'),
+    'vin': (_text, 'vin'),
+    'registration': (_text, 'basicDetails_vrm', 'pageProps_vehicle_registration', 'vrm'),
+    'color': (_text, 'basicDetails_colour', 'pageProps_vehicle_specs_primaryColour'),
+    'price': (_float, 'pageProps_vehicle_specs_price'),
+}
+
+ENGINE = {
+    'engine_size': (_int, 'basicDetails_engineSize', 'pageProps_vehicle_specs_engineCapacity'),
+    'power_bhp': (_int, 'Power (bhp)'),
+    'power_kw': (_float, 'Power (kw)'),
+    'number_of_cylinders': (_int, 'Number of cylinders'),
+    'fuel_system': (_text, 'Fuel system'),
+    'aspiration': (_text, 'Aspiration'),
+    'fuel_consumption_l_100km': (_float, 'l/100km'),
+    'fuel_consumption_mpg': (_float, 'mpg'),
+    'torque_ftlb': (_float, 'Torque (ftLb)'),
+    'torque_nm': (_float, 'Torque (nm)'),
+}
+
+TRANSMISSION = {
+    'type': (_text, 'Transmission'),
+    'number_of_gears': (_int, 'Number of gears'),
+}
+
+PERFORMANCE = {
+    'top_speed_kph': (_int, 'Top speed (kph)'),
+    'top_speed_mph': (_int, 'Top speed (mph)'),
+}
+
+DIMENSIONS = {
+    'length': (_int, 'Car length'),
+    'height': (_int, 'Height'),
+    'width': (_int, 'Width'),
+    'wheel_base': (_int, 'Wheel base'),
+    'unladen_weight': (_int, 'Unladen weight'),
+}
+
+CHASSIS = {
+    'drive_type': (_text, 'Drive type'),
+    'driving_axle': (_text, 'Driving axle'),
+    'number_of_axles': (_int, 'Number of axles'),
+    'doors': (_int, 'basicDetails_doors', 'Number of doors'),
+}
+
+FUEL = {
+    'fuel_type': (_text, 'basicDetails_fuelType', 'Fuel type', 'pageProps_vehicle_fuelType', 'fuelType'),
+    'fuel_tank_capacity': (_int, 'Fuel tank capacity'),
+}
+
+REGISTRATION_INFO = {
+    'manufacture_date': (_timestamp, 'basicDetails_manufactureDate'),
+    'first_registration_date': (_timestamp, 'pageProps_vehicle_monthOfFirstRegistration'),
+    'last_v5c_issue_date': (_timestamp, 'basicDetails_lastV5CIssueDate', 'pageProps_vehicle_dateOfLastV5CIssued'),
+    'mot_due_date': (_timestamp, 'basicDetails_motDueDate', 'pageProps_vehicle_mot_motExpiryDate'),
+    'tax_due_date': (_timestamp, 'pageProps_vehicle_tax_taxDueDate'),
+}
+
+VEHICLE_STATUS = {
+    'type_approval_category': (_text, 'Type approval category', 'pageProps_vehicle_specs_typeApproval'),
+    'euro_status': (_text, 'Euro status'),
+    'co2_emissions': (_float, 'pageProps_vehicle_specs_co2Emissions'),
+    'average_miles_per_year': (_float, 'pageProps_vehicle_averageMilesPy'),
+    'has_plate_changes': (_bool, 'provenance_hasPlateChanges'),
+    'has_colour_changes': (_bool, 'provenance_hasColourChanges'),
+    'has_salvage_records': (_bool, 'provenance_hasSalvageRecords'),
+    'has_mileage_anomaly': (_bool, 'provenance_hasMileageAnomaly'),
+    'is_exported': (_bool, 'provenance_isExported'),
+    'is_possible_taxi': (_bool, 'provenance_isPossibleTaxi'),
+    'is_stolen': (_flag, 'theft'),
+    'mot_valid': (_equals('valid'), 'pageProps_vehicle_mot_motStatus'),
+    'tax_valid': (_equals('taxed'), 'pageProps_vehicle_tax_taxStatus'),
+}
+
+SCORE = {
+    'overall_score': (_int, 'pageProps_scores_score', 'pageProps_brandNewScores_score'),
+    'age_score': (_int, 'pageProps_brandNewScores_age'),
+    'mileage_score': (_int, 'pageProps_brandNewScores_mileage'),
+    'mot_history_score': (_int, 'pageProps_brandNewScores_motHistory'),
+    'average_score': (_int, 'pageProps_scores_averageScore'),
+}
+
+MARKET_DATA = {
+    'estimated_value': (_float, 'autotrader_price_avg'),
+    'similar_listings': (_int, 'autotrader_total_listings', 'ebay_listings'),
+}
+
+def _resolve(values, fields):
+    resolved = {}
+    for name, (convert, *keys) in fields.items():
+        for key in keys:
+            value = values.get(key)
+            if value is None or value == '':
+                continue
+            try:
+                converted = convert(value)
+            except (TypeError, ValueError):
+                continue
+            if converted is not None:
+                resolved[name] = converted
+                break
+    return resolved
+
+def _mot_tests(values):
+    # DVSA's own history wins over the copy VehicleScore embeds in its page data
+    mot_history = values.get('mot_history')
+    tests = mot_history.get('motTests') if isinstance(mot_history, dict) else None
+    if not tests:
+        tests = values.get('pageProps_vehicle_mot_motTests')
+    if not isinstance(tests, list):
+        return []
+
+    mot_tests = []
+    for test in tests:
+        if not isinstance(test, dict):
+            continue
+        advisories, defects = [], []
+        for item in test.get('defects') or test.get('rfrAndComments') or []:
+            text = item.get('text') if isinstance(item, dict) else None
+            if text:
+                (advisories if str(item.get('type', '')).upper() in ('ADVISORY', 'USER ENTERED') else defects).append(text)
+        fields = _resolve(test, {
+            'date': (_timestamp, 'completedDate'),
+            'result': (_text, 'testResult'),
+            'mileage': (_int, 'odometerValue'),
+            'expiry_date': (_timestamp, 'expiryDate'),
+        })
+        mot_tests.append(MOTTest(advisories=advisories, defects=defects, **fields))
+    return mot_tests
+
+def _price_range(values):
+    for prefix in ('autotrader_price', 'ebay_price'):
+        low, high = values.get(f'{prefix}_min'), values.get(f'{prefix}_max')
+        if low is not None and high is not None:
+            return (low, high)
+    return None
+
+def build_vehicle_model(values):
+    """Resolve a record's flattened source keys into a VehicleDataModel.
+
+    values maps raw keys to their latest value (see Utils.pipeline.latest_values).
+    Each field takes the first usable value from its sources in precedence order.
+    """
+    return VehicleDataModel(
+        vehicle_info=VehicleInfo(**_resolve(values, VEHICLE_INFO)),
+        specifications=VehicleSpecifications(
+            engine=EngineSpecs(**_resolve(values, ENGINE)),
+            transmission=TransmissionSpecs(**_resolve(values, TRANSMISSION)),
+            performance=PerformanceSpecs(**_resolve(values, PERFORMANCE)),
+            dimensions=DimensionSpecs(**_resolve(values, DIMENSIONS)),
+            chassis=ChassisSpecs(**_resolve(values, CHASSIS)),
+            fuel=FuelSpecs(**_resolve(values, FUEL)),
+        ),
+        registration_info=RegistrationInfo(**_resolve(values, REGISTRATION_INFO)),
+        vehicle_status=VehicleStatus(**_resolve(values, VEHICLE_STATUS)),
+        score=VehicleScore(**_resolve(values, SCORE)),
+        mot_history=_mot_tests(values),
+        market_data=MarketData(price_range=_price_range(values), **_resolve(values, MARKET_DATA)),
+    )
+
+def vehicle_model_dict(model, drop_empty=False):
+    """Plain dict of a VehicleDataModel, optionally without unset fields."""
+    data = asdict(model)
+    return _drop_empty(data) if drop_empty else data
+
+def _drop_empty(value):
+    if isinstance(value, dict):
+        pruned = {key: _drop_empty(item) for key, item in value.items()}
+        return {key: item for key, item in pruned.items() if item not in (None, [], {}, ())}
+    if isinstance(value, list):
+        return [_drop_empty(item) for item in value]
+    return value
+
+__all__ = ['build_vehicle_model', 'vehicle_model_dict']
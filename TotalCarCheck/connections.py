@@ -1,13 +1,19 @@
 import os
 from curl_cffi import requests
 from dotenv import load_dotenv
+from Utils.sessions import ThreadLocalSession
+
+REQUEST_TIMEOUT = 10
 
 # Load environment variables from .env file in parent directory
-load_dotenv(dotenv_path='../.env')
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
 class TotalCarCheck:
-    def __init__(self, vrm, vin):
-        self.url = f"https://totalcarcheck.co.uk/CheckVin?vrm={vrm}&vin={vin}"
+    BASE_URL = "https://totalcarcheck.co.uk/CheckVin"
+
+    def __init__(self, vrm=None, vin=None):
+        self.vrm = vrm
+        self.vin = vin
         self.headers = {
             "Accept": "*/*",
             "Accept-Encoding": "gzip, deflate, br",
@@ -21,9 +27,11 @@ class TotalCarCheck:
             "Sec-Fetch-Site": "same-origin",
             "User-Agent": os.getenv('USER_AGENT')
         }
+        self.sessions = ThreadLocalSession(requests.Session)
 
-    def check_vin(self):
-        response = requests.get(self.url, headers=self.headers)
+    def check_vin(self, vrm=None, vin=None):
+        url = f"{self.BASE_URL}?vrm={vrm or self.vrm}&vin={vin or self.vin}"
+        response = self.sessions.get().get(url, headers=self.headers, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Raises an HTTPError for bad responses
         return response.json()
 
@@ -1,11 +1,14 @@
 from .connections import TotalCarCheck as TotalCarCheckAPI
 from Utils.utils import flatten_dict
 from Utils.logging import logger
+from Utils.pipeline import Source, HOUR
+from Utils.vrm import normalise_vrm
 
-def get_total_car_check(vrm, vin):
+def get_total_car_check(vrm, vin, client=None):
+    vrm = normalise_vrm(vrm)
     try:
-        tcc_api = TotalCarCheckAPI(vrm, vin)
-        tcc_data = tcc_api.check_vin()
+        tcc_api = client or TotalCarCheckAPI()
+        tcc_data = tcc_api.check_vin(vrm, vin)
         
         if not tcc_data:
             return None
@@ -18,4 +21,16 @@ def get_total_car_check(vrm, vin):
         logger.write(str(e), is_exception=True)
         return None
 
+# Theft and write-off markers can change at any time
+SOURCE = Source(
+    'totalcarcheck',
+    get_total_car_check,
+    # Only Carly outputs a VIN, so under 'fast' this runs only for plates with one stored
+    inputs=('vrm', 'vin'),
+    client=TotalCarCheckAPI,
+    ttl=HOUR,
+    cost=1,
+    latency=1,
+)
+
 __all__ = ['get_total_car_check']
@@ -1,56 +1,252 @@
 import json
 import fcntl
+import mmap
+import struct
+import zlib
 from pathlib import Path
 from datetime import datetime
 import threading
+from contextlib import contextmanager
 import tempfile
 import io
 import sys
 import signal
 import os
 import time
+from Utils.vrm import normalise_vrm, InvalidVRM
+from Utils.pipeline import latest_values
+from Utils.logging import logger
+
+# Compact once dead bytes (superseded records and tombstones) exceed both of these
+COMPACT_MIN_BYTES = 1024 * 1024
+COMPACT_RATIO = 1.0
+
+# Sidecar index (<log>.idx): a header, then (key length, key, offset, length) entries sorted by key.
+# Startup adopts it instead of parsing every record, but only while the log's inode, size, mtime
+# and the bytes just before the indexed end still match; lines appended since are tail-scanned,
+# and any mismatch falls back to a full rebuild. generation counts the log files this instance
+# has seen replaced by compaction.
+INDEX_MAGIC = b'VIDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sHQQQqIQ')  # magic, version, generation, inode, end, mtime_ns, tail crc32, entries
+INDEX_ENTRY = struct.Struct('<QI')
+# The sidecar is rewritten once this much of the log is only covered by tail scans
+INDEX_FLUSH_BYTES = 256 * 1024
+# Bytes before the indexed end that must still match, in case the inode was reused
+INDEX_TAIL_CHECK = 4096
+# Trailing key on each record line mapping its fields to the byte spans of their values
+FIELDS_KEY = '_fields'
+FIELDS_MARKER = f', "{FIELDS_KEY}": '.encode('ascii')
 
 class Database:
-    def __init__(self):
-        self.file_path = Path(__file__).parent / "db.json"
+    """Append-only log of vehicle records, one JSON line per version (see _encode_line).
+
+    An in-memory index maps each VRM to its latest line, persisted beside the
+    log (see INDEX_HEADER); reads slice that line from an mmap of the log.
+    Deletes append tombstones, and a background thread compacts the log once
+    superseded lines outweigh the live ones.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = Path(file_path) if file_path else Path(__file__).parent / "db.json"
+        self.index_path = self.file_path.with_name(self.file_path.name + '.idx')
         self.index = {}
         self.lock = threading.Lock()
+        self.inode = None
+        self.pinned = None
+        self.map = None
+        self.end = 0
+        self.live_bytes = 0
+        self.generation = 0
+        self.indexed_end = 0
+        self.compacting = False
         self._load_index()
 
     def _load_index(self):
+        with self.lock, self._open_log(fcntl.LOCK_SH):
+            pass
+
+    @contextmanager
+    def _open_log(self, lock_type):
+        # Reopen if a compaction swapped the file in while we waited for the lock
+        while True:
+            f = self.file_path.open('a+b')
+            fcntl.flock(f, lock_type)
+            stat = os.fstat(f.fileno())
+            try:
+                current = os.stat(self.file_path).st_ino == stat.st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+        try:
+            if stat.st_ino != self.inode or stat.st_size < self.end:
+                self._reset_index(f)
+                if not self._load_sidecar(f, stat):
+                    self.generation += 1
+            if stat.st_size > self.end:
+                self._scan(f, self.end)
+                self._maybe_save_sidecar(f)
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def _reset_index(self, f):
+        # Holding the file open keeps its inode from being reused by a later compaction,
+        # so a matching inode always means the same log
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.pinned is not None:
+            os.close(self.pinned)
+        self.pinned = os.dup(f.fileno())
         self.index.clear()
-        if self.file_path.exists():
-            with self.file_path.open('r') as f:
-                fcntl.flock(f, fcntl.LOCK_SH)
-                offset = 0
-                for line in f:
-                    try:
-                        record = json.loads(line.strip())
-                        vrm = list(record.keys())[0]
-                        self.index[vrm] = offset
-                        offset += len(line)
-                    except json.JSONDecodeError:
-                        print(f"Error decoding JSON: {line}")
-                fcntl.flock(f, fcntl.LOCK_UN)
+        self.inode = os.fstat(self.pinned).st_ino
+        self.end = 0
+        self.live_bytes = 0
+        self.indexed_end = 0
 
-    def write(self, vrm, value):
+    def _load_sidecar(self, f, stat):
+        """Adopt the persisted index if it still describes this log; returns whether it did."""
+        try:
+            with self.index_path.open('rb') as idx:
+                data = idx.read()
+            magic, version, generation, inode, end, mtime_ns, tail_crc, count = INDEX_HEADER.unpack_from(data, 0)
+        except (OSError, struct.error):
+            return False
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or inode != stat.st_ino or stat.st_size < end:
+            return False
+        # Same size means nothing was appended since, so the mtime must not have moved either
+        if stat.st_size == end and stat.st_mtime_ns != mtime_ns:
+            return False
+        if _tail_crc(f, end) != tail_crc:
+            return False
+
+        index = {}
+        position = INDEX_HEADER.size
+        try:
+            for _ in range(count):
+                (key_length,) = struct.unpack_from('<H', data, position)
+                key = data[position + 2:position + 2 + key_length].decode('utf-8')
+                position += 2 + key_length
+                index[key] = INDEX_ENTRY.unpack_from(data, position)
+                position += INDEX_ENTRY.size
+        except (struct.error, UnicodeDecodeError):
+            return False
+
+        self.index.update(index)
+        self.live_bytes = sum(length for _, length in index.values())
+        self.end = self.indexed_end = end
+        self.generation = max(self.generation, generation)
+        return True
+
+    def _maybe_save_sidecar(self, f):
+        if self.end - self.indexed_end >= INDEX_FLUSH_BYTES:
+            self._save_sidecar(f)
+
+    def _save_sidecar(self, f):
+        # Written beside the index and renamed over it, so readers never see a partial file
+        stat = os.fstat(f.fileno())
+        entries = [INDEX_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, self.generation, stat.st_ino, self.end, stat.st_mtime_ns,
+            _tail_crc(f, self.end), len(self.index),
+        )]
+        for key in sorted(self.index):
+            encoded = key.encode('utf-8')
+            entries.append(struct.pack('<H', len(encoded)) + encoded + INDEX_ENTRY.pack(*self.index[key]))
+        temp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            with temp_path.open('wb') as idx:
+                idx.write(b''.join(entries))
+            os.replace(temp_path, self.index_path)
+            self.indexed_end = self.end
+        except OSError as e:
+            logger.write(f"Error saving index {self.index_path}: {e}", is_exception=True, stream=sys.stderr)
+
+    def _scan(self, f, offset):
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                # A torn append from a crashed writer; the next write truncates it
+                break
+            try:
+                record = json.loads(line)
+                vrm = _record_key(record)
+                value = next(iter(record.values()))
+            except (json.JSONDecodeError, UnicodeDecodeError, StopIteration, TypeError, AttributeError):
+                logger.write(f"Error decoding JSON at offset {offset}: {line[:200]!r}", stream=sys.stderr)
+            else:
+                if value is None:
+                    self._drop(vrm)
+                else:
+                    self._set(vrm, offset, len(line))
+            offset += len(line)
+        self.end = offset
+
+    def _set(self, vrm, offset, length):
+        self._drop(vrm)
+        self.index[vrm] = (offset, length)
+        self.live_bytes += length
+
+    def _drop(self, vrm):
+        entry = self.index.pop(vrm, None)
+        if entry:
+            self.live_bytes -= entry[1]
+
+    def _in_sync(self):
+        # One stat() tells whether another process appended to or replaced the log
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino == self.inode and stat.st_size == self.end
+
+    def _slice(self, offset, length):
+        # Lines are never changed once written, so a map taken once per generation stays valid
+        if self.map is None or len(self.map) < offset + length:
+            # Grown by appends since it was mapped; map the whole log again
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.pinned, 0, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length]
+
+    def _record_bytes(self, vrm):
         with self.lock:
-            current_time = datetime.now().isoformat()
-
-            def remove_rfr_comments(data):
-                if isinstance(data, dict):
-                    data.pop('rfrAndComments', None)
-                    data.pop('basicDetails_imageUrl', None)
-                    for key, val in data.items():
-                        data[key] = remove_rfr_comments(val)
-                elif isinstance(data, list):
-                    return [remove_rfr_comments(item) for item in data]
-                return data
-
-            # Remove 'rfrAndComments' recursively from the input value
-            value = remove_rfr_comments(value)
-
-            if vrm not in self.index:
+            if not self._in_sync():
+                with self._open_log(fcntl.LOCK_SH):
+                    pass
+            entry = self.index.get(vrm)
+            return self._slice(*entry) if entry else None
+
+    def _read_at(self, vrm):
+        record = json.loads(self._slice(*self.index[vrm]))
+        return next(iter(record.values()))
+
+    def _append(self, f, vrm, value):
+        line = _encode_line(vrm, value)
+        if os.fstat(f.fileno()).st_size != self.end:
+            f.truncate(self.end)
+        # The file is opened for append, so this lands at the end even if it grew
+        f.write(line)
+        f.flush()
+        if value is None:
+            self._drop(vrm)
+        else:
+            self._set(vrm, self.end, len(line))
+        self.end += len(line)
+
+    def write(self, vrm, value):
+        vrm = normalise_vrm(vrm)
+        current_time = datetime.now().isoformat()
+        value = _remove_rfr_comments(value)
+
+        with self.lock, self._open_log(fcntl.LOCK_EX) as f:
+            existing_record = self._read_at(vrm) if vrm in self.index else None
+            if existing_record is None:
                 new_value = {
                     key: [{
                         'value': val,
@@ -62,7 +258,6 @@ class Database:
                 new_value['updated_at'] = current_time
                 new_value.setdefault('searched', [])
             else:
-                existing_record = self._read_record_without_update(vrm)
                 new_value = existing_record.copy()
                 for key, val in value.items():
                     if key not in new_value:
@@ -75,72 +270,193 @@ class Database:
                         })
                 new_value['updated_at'] = current_time
 
-            with self.file_path.open('r+') as f:
-                fcntl.flock(f, fcntl.LOCK_EX)
-                content = f.read()
-                records = [json.loads(line) for line in content.splitlines() if line.strip()]
-                updated_records = [record for record in records if list(record.keys())[0] != vrm]
-                updated_records.append({vrm: new_value})
-                
-                f.seek(0)
-                for record in updated_records:
-                    json.dump(record, f)
-                    f.write('\n')
-                f.truncate()
-                fcntl.flock(f, fcntl.LOCK_UN)
-
-            self._load_index()
+            self._append(f, vrm, new_value)
+            self._maybe_save_sidecar(f)
+        self._maybe_compact()
+
+    def put(self, vrm, value):
+        """Set fields keeping only their newest value, for data that is overwritten rather than versioned."""
+        vrm = normalise_vrm(vrm)
+        current_time = datetime.now().isoformat()
+        with self.lock, self._open_log(fcntl.LOCK_EX) as f:
+            record = self._read_at(vrm) if vrm in self.index else None
+            if record is None:
+                record = {'created_at': current_time, 'searched': []}
+            for key, val in value.items():
+                record[key] = [{'value': val, 'created_at': current_time}]
+            record['updated_at'] = current_time
+            self._append(f, vrm, record)
+            self._maybe_save_sidecar(f)
+        self._maybe_compact()
 
     def readReg(self, vrm):
-        with self.lock:
-            if vrm in self.index:
-                with self.file_path.open('r') as f:
-                    fcntl.flock(f, fcntl.LOCK_SH)
-                    f.seek(self.index[vrm])
-                    line = f.readline().strip()
-                    fcntl.flock(f, fcntl.LOCK_UN)
-                    try:
-                        record = json.loads(line)
-                        data = record[vrm]
-                        return data
-                    except json.JSONDecodeError:
-                        print(f"Error decoding JSON for VRM: {vrm}")
-                        print(f"Line content: {line}")
-                        self._remove_corrupted_record(vrm)
-                        return None
-            else:
-                return None
+        vrm = normalise_vrm(vrm)
+        line = self._record_bytes(vrm)
+        if line is None:
+            return None
+        try:
+            return next(iter(json.loads(line).values()))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.write(f"Error decoding JSON for VRM: {vrm}: {e}", is_exception=True, stream=sys.stderr)
+        self._remove_corrupted_record(vrm)
+        return None
 
-    def _read_record_without_update(self, vrm):
-        with self.file_path.open('r') as f:
-            fcntl.flock(f, fcntl.LOCK_SH)
-            f.seek(self.index[vrm])
-            line = f.readline().strip()
-            fcntl.flock(f, fcntl.LOCK_UN)
-            record = json.loads(line)
-            return record[vrm]
+    def read_fields(self, vrm, fields, latest_only=False):
+        """Only the given fields of vrm's record, or None if there is no record.
+
+        Fields the record doesn't have are left out. With latest_only each field
+        is its newest value rather than its whole history, as latest_values gives.
+        """
+        vrm = normalise_vrm(vrm)
+        line = self._record_bytes(vrm)
+        if line is None:
+            return None
+
+        marker = line.rfind(FIELDS_MARKER)
+        if marker < 0:
+            record = next(iter(json.loads(line).values()))
+            selected = {field: record[field] for field in fields if field in record}
+            return latest_values(selected) if latest_only else selected
+
+        directory = json.loads(line[marker + len(FIELDS_MARKER):].rstrip()[:-1])
+        selected = {}
+        for field in fields:
+            span = directory.get(field)
+            if span is None:
+                continue
+            if latest_only and len(span) == 4:
+                # Decode only the newest history entry
+                selected[field] = json.loads(line[span[2]:span[2] + span[3]])['value']
+                continue
+            value = json.loads(line[span[0]:span[0] + span[1]])
+            selected[field] = latest_values({field: value})[field] if latest_only else value
+        return selected
 
     def delete(self, vrm):
-        with self.lock:
+        vrm = normalise_vrm(vrm)
+        with self.lock, self._open_log(fcntl.LOCK_EX) as f:
             if vrm in self.index:
-                with self.file_path.open('r+') as f:
-                    fcntl.flock(f, fcntl.LOCK_EX)
-                    content = f.read()
-                    records = [json.loads(line) for line in content.splitlines() if line.strip()]
-                    updated_records = [record for record in records if list(record.keys())[0] != vrm]
-                    
-                    f.seek(0)
-                    for record in updated_records:
-                        json.dump(record, f)
-                        f.write('\n')
-                    f.truncate()
-                    fcntl.flock(f, fcntl.LOCK_UN)
-
-                self._load_index()
+                self._append(f, vrm, None)
+                self._maybe_save_sidecar(f)
+        self._maybe_compact()
 
     def _remove_corrupted_record(self, vrm):
         self.delete(vrm)
 
+    def _needs_compaction(self):
+        dead_bytes = self.end - self.live_bytes
+        return dead_bytes >= COMPACT_MIN_BYTES and dead_bytes >= self.live_bytes * COMPACT_RATIO
+
+    def _maybe_compact(self):
+        if not self._needs_compaction():
+            return
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+        threading.Thread(target=self.compact, name='db-compact', daemon=True).start()
+
+    def compact(self, force=False):
+        """Rewrite the log with only each VRM's latest version and swap it in atomically."""
+        try:
+            with self.lock, self._open_log(fcntl.LOCK_EX) as f:
+                # Another process may have compacted it while we waited for the lock
+                if not force and not self._needs_compaction():
+                    return
+                before = self.end
+                temp_path = self.file_path.with_name(self.file_path.name + '.compact')
+                entries = sorted(self.index.items(), key=lambda item: item[1][0])
+                with temp_path.open('w+b') as out:
+                    for vrm, (offset, length) in entries:
+                        out.write(self._slice(offset, length))
+                    out.flush()
+                    os.fsync(out.fileno())
+                    os.replace(temp_path, self.file_path)
+
+                    self._reset_index(out)
+                    self.generation += 1
+                    for vrm, (_, length) in entries:
+                        self._set(vrm, self.end, length)
+                        self.end += length
+                    self._save_sidecar(out)
+                logger.write(f"Compacted {self.file_path.name}: {before} -> {self.end} bytes", stream=sys.stderr)
+        finally:
+            self.compacting = False
+
+def _encode_line(vrm, value):
+    """One log line: {vrm: record, "_fields": {field: [start, length(, last_start, last_length)]}}.
+
+    Spans are byte offsets into the line; the last pair, present for history
+    lists, locates the newest entry, so read_fields decodes only the fields it
+    is asked for. Encoding is ASCII-only, so character and byte offsets agree.
+    A tombstone is {vrm: null}. Lines written before the directory existed
+    have none and are decoded whole.
+    """
+    if value is None:
+        return (json.dumps({vrm: None}) + '\n').encode('ascii')
+
+    parts = ['{', json.dumps(vrm), ': {']
+    position = sum(len(part) for part in parts)
+    directory = {}
+    for i, (key, val) in enumerate(value.items()):
+        prefix = (', ' if i else '') + json.dumps(key) + ': '
+        start = position + len(prefix)
+        if isinstance(val, list) and val and isinstance(val[-1], dict) and 'value' in val[-1]:
+            items = [json.dumps(item) for item in val]
+            encoded = '[' + ', '.join(items) + ']'
+            directory[key] = [start, len(encoded), start + len(encoded) - 1 - len(items[-1]), len(items[-1])]
+        else:
+            encoded = json.dumps(val)
+            directory[key] = [start, len(encoded)]
+        parts += [prefix, encoded]
+        position = start + len(encoded)
+    parts += ['}', FIELDS_MARKER.decode('ascii'), json.dumps(directory, separators=(',', ':')), '}\n']
+    return ''.join(parts).encode('ascii')
+
+def _tail_crc(f, end):
+    start = max(end - INDEX_TAIL_CHECK, 0)
+    return zlib.crc32(os.pread(f.fileno(), end - start, start))
+
+def _remove_rfr_comments(data):
+    # Drops 'rfrAndComments' and image URLs at any depth; they are bulky and never read back
+    if isinstance(data, dict):
+        data.pop('rfrAndComments', None)
+        data.pop('basicDetails_imageUrl', None)
+        for key, val in data.items():
+            data[key] = _remove_rfr_comments(val)
+    elif isinstance(data, list):
+        return [_remove_rfr_comments(item) for item in data]
+    return data
+
+def get_database():
+    """The configured storage backend: VEHICLE_DB_BACKEND is 'json' (default) or 'sqlite'.
+
+    VEHICLE_DB_PATH overrides the backend's default file.
+    """
+    backend = os.getenv('VEHICLE_DB_BACKEND', 'json').strip().lower()
+    path = os.getenv('VEHICLE_DB_PATH') or None
+    if backend == 'json':
+        return Database(path)
+    if backend == 'sqlite':
+        from Utils.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(path)
+    raise ValueError(f"Unknown VEHICLE_DB_BACKEND: {backend!r}, expected 'json' or 'sqlite'")
+
+def meta_store_for(database):
+    """A store of the same kind beside database's file, for per-VRM data that is
+    overwritten on every lookup (AI reports, fetch markers) and so is kept out
+    of the versioned vehicle records."""
+    path = database.file_path
+    return type(database)(path.with_name(f"{path.stem}_meta{path.suffix}"))
+
+def _record_key(record):
+    # Records written before keys were canonical may be stored under any case or spacing
+    vrm = next(iter(record))
+    try:
+        return normalise_vrm(vrm)
+    except InvalidVRM:
+        return vrm
+
 def test_database():
     # Create a temporary file for testing
     with tempfile.NamedTemporaryFile(delete=False) as temp_file:
@@ -152,7 +468,7 @@ def test_database():
             db.write('XYZ789', {'owner': 'Jane Smith', 'model': 'Honda'})
             print(db.readReg('ABC123'))
             print(db.readReg('XYZ789'))
-            print(db.readReg('NONEXISTENT'))
+            print(db.readReg('ZZ99ZZZ'))
 
             print("\n2. Update Existing Record Test")
             db.write('ABC123', {'color': 'Red'})
@@ -171,16 +487,9 @@ def test_database():
                 else:
                     print("Error: Unable to read search count for ABC123")
 
-                # Simulate a search by updating the 'searched' attribute
+                # Simulate a search; write() appends it to the 'searched' history
                 if record:
-                    current_time = datetime.now().isoformat()
-                    if 'searched' not in record:
-                        record['searched'] = []
-                    record['searched'].append({
-                        'value': len(record['searched']) + 1,
-                        'created_at': current_time
-                    })
-                    db.write('ABC123', record)
+                    db.write('ABC123', {'searched': len(record.get('searched', [])) + 1})
 
             print("\n4. Delete Record Test")
             db.write('DEL111', {'note': 'To be deleted'})
@@ -188,7 +497,39 @@ def test_database():
             db.delete('DEL111')
             print("After deletion:", db.readReg('DEL111'))
 
-            print("\n5. Database state after all operations:")
+            print("\n5. Tombstone Test")
+            reopened = Database(temp_file.name)
+            print("Deleted record after reopening:", reopened.readReg('DEL111'))
+            reopened.write('DEL111', {'note': 'Written again'})
+            print("Rewritten after deletion:", db.readReg('DEL111')['note'][-1]['value'])
+
+            print("\n6. Compaction Test")
+            for i in range(5):
+                db.write('XYZ789', {'mileage': 1000 * i})
+            before = os.path.getsize(temp_file.name)
+            db.compact(force=True)
+            print(f"Log size: {before} -> {os.path.getsize(temp_file.name)} bytes, generation {db.generation}")
+            print("Mileage history after compaction:", [entry['value'] for entry in db.readReg('XYZ789')['mileage']])
+            print("Other instance after compaction:", reopened.readReg('ABC123')['color'][-1]['value'])
+
+            print("\n7. Sidecar Index Test")
+            reloaded = Database(temp_file.name)
+            print(f"Loaded from sidecar: {reloaded.indexed_end > 0}, same index: {reloaded.index == db.index}")
+            # Rewrite a byte in place: same size, but the mtime and tail checksum no longer match
+            with open(temp_file.name, 'r+b') as f:
+                f.seek(os.path.getsize(temp_file.name) - 10)
+                byte = f.read(1)
+                f.seek(-1, os.SEEK_CUR)
+                f.write(byte)
+            rebuilt = Database(temp_file.name)
+            print(f"Stale sidecar rejected: {rebuilt.indexed_end == 0}, same index: {rebuilt.index == db.index}")
+
+            print("\n8. Read Fields Test")
+            print("Mileage history:", db.read_fields('XYZ789', ['mileage', 'owner']))
+            print("Latest only:", db.read_fields('XYZ789', ['mileage', 'owner', 'missing'], latest_only=True))
+            print("Unknown VRM:", db.read_fields('ZZ99ZZZ', ['mileage']))
+
+            print("\n9. Database state after all operations:")
             db._load_index()
             print(f"Records in database: {list(db.index.keys())}")
 
@@ -198,8 +539,9 @@ def test_database():
             traceback.print_exc()
 
         finally:
-            # Clean up the temporary file
+            # Clean up the temporary file and its sidecar index
             Path(temp_file.name).unlink()
+            db.index_path.unlink(missing_ok=True)
 
 if __name__ == "__main__":
     def timeout_handler(signum, frame):
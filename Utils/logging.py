@@ -39,7 +39,8 @@ class Logger:
             conn.commit()
             conn.close()
 
-    def write(self, message, is_exception=False):
+    def write(self, message, is_exception=False, stream=None):
+        # stream is where the entry is echoed (stdout by default); pass sys.stderr to keep stdout clean
         timestamp = datetime.datetime.now().isoformat()
         
         if is_exception:
@@ -65,9 +66,9 @@ class Logger:
                     INSERT INTO logs (timestamp, file, line_number, method_name, message)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (timestamp, file_path, line_number, method_name, message))
-            print(message)
+            print(message, file=stream)
         else:
-            print(log_entry)
+            print(log_entry, file=stream)
 
     def read_all(self):
         with sqlite3.connect(self.db_path) as conn:
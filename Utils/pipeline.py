@@ -0,0 +1,346 @@
+import os
+import time
+from datetime import datetime
+import importlib
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from Utils.logging import logger
+from Utils.singleflight import SingleFlight
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE_TIMEOUT = 20
+FETCHED_AT_PREFIX = 'fetched_at_'
+# How often run() checks whether a queued source has started and its own clock is ticking
+QUEUED_POLL = 0.05
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Most expensive source (by Source.cost) each lookup profile will run; None for no limit
+PROFILES = {
+    'fast': 1,      # JSON APIs only
+    'standard': 3,  # plus scraped HTML
+    'full': None,   # plus market sampling
+}
+DEFAULT_PROFILE = 'standard'
+
+class Source:
+    """Declaration of one enrichment source.
+
+    fetch is called as fetch(**inputs, client=client) once every name in inputs is
+    known for the lookup, and returns a flattened dict (or None). outputs maps the
+    canonical names this source can supply (vin, make, ...) to the flattened keys
+    they are read from, so downstream sources can depend on them. Results are
+    merged into the vehicle record unless key is set, in which case they are kept
+    whole under that key. ttl is how many seconds a stored result stays fresh
+    (None for never). timeout, in seconds, overrides the pipeline's default
+    per-source budget. cost is a relative weight used to pick sources for a
+    lookup profile (see PROFILES) and latency the typical seconds a fetch takes.
+    A source declared with enabled=False is registered but not run until enabled.
+    """
+
+    def __init__(self, name, fetch, inputs=('vrm',), outputs=None, client=None, key=None, ttl=None, enabled=True, timeout=None,
+                 cost=1, latency=None):
+        self.name = name
+        self.fetch = fetch
+        self.inputs = tuple(inputs)
+        self.outputs = outputs or {}
+        self.client = client
+        self.key = key
+        self.ttl = ttl
+        self.enabled = enabled
+        self.timeout = timeout
+        self.cost = cost
+        self.latency = latency
+
+    def extract(self, data):
+        values = {}
+        for output, flat_keys in self.outputs.items():
+            for flat_key in (flat_keys,) if isinstance(flat_keys, str) else flat_keys:
+                if data.get(flat_key):
+                    values[output] = data[flat_key]
+                    break
+        return values
+
+    @property
+    def marker(self):
+        # Stored alongside the data to record when this source was last fetched
+        return f"{FETCHED_AT_PREFIX}{self.name}"
+
+    def age(self, values, now=None):
+        """Seconds since this source was stored, given a record's latest values, or None if it never was."""
+        fetched_at = values.get(self.marker)
+        if not fetched_at:
+            return None
+        try:
+            return max(((now or datetime.now()) - datetime.fromisoformat(fetched_at)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def is_fresh(self, age):
+        return age is not None and (self.ttl is None or age < self.ttl)
+
+    def __repr__(self):
+        return f"Source({self.name!r}, inputs={self.inputs}, outputs={tuple(self.outputs)}, cost={self.cost})"
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'inputs': list(self.inputs),
+            'outputs': list(self.outputs),
+            'cost': self.cost,
+            'latency': self.latency,
+            'ttl': self.ttl,
+        }
+
+def latest_values(record):
+    """Collapse a stored record's per-field history to the most recent value of each field."""
+    values = {}
+    for key, entries in (record or {}).items():
+        if isinstance(entries, list) and entries and isinstance(entries[-1], dict) and 'value' in entries[-1]:
+            values[key] = entries[-1]['value']
+        else:
+            values[key] = entries
+    return values
+
+_sources = None
+_sources_lock = threading.Lock()
+
+def load_sources():
+    """Import every top-level package's index module and collect the SOURCE it declares.
+
+    Adding a source is a matter of declaring SOURCE in its package; a package that
+    splits one upstream into several sources declares SOURCES instead. The result
+    is cached for the life of the process.
+    """
+    global _sources
+    with _sources_lock:
+        if _sources is None:
+            sources = []
+            for package in sorted(os.listdir(ROOT_DIR)):
+                if not os.path.isfile(os.path.join(ROOT_DIR, package, 'index.py')):
+                    continue
+                try:
+                    module = importlib.import_module(f"{package}.index")
+                except Exception as e:
+                    logger.write(f"Error loading source package {package}: {str(e)}", is_exception=True)
+                    continue
+                declared = getattr(module, 'SOURCES', None) or (getattr(module, 'SOURCE', None),)
+                sources.extend(source for source in declared if isinstance(source, Source))
+            _sources = _order_sources(sources)
+        return _sources
+
+def _order_sources(sources):
+    # Dependency depth first, then name: a stable topological order for merging
+    produced_by = {}
+    for source in sources:
+        for output in source.outputs:
+            produced_by.setdefault(output, []).append(source)
+
+    depths = {}
+    def depth(source, visiting=()):
+        if source.name not in depths:
+            parents = [parent for name in source.inputs for parent in produced_by.get(name, [])
+                       if parent is not source and parent.name not in visiting]
+            depths[source.name] = 1 + max((depth(parent, visiting + (source.name,)) for parent in parents), default=-1)
+        return depths[source.name]
+
+    return sorted(sources, key=lambda source: (depth(source), source.name))
+
+class Pipeline:
+    """Runs a set of declared sources with as much parallelism as their inputs allow.
+
+    Each source starts the moment all of its inputs are known, either from the
+    initial context or from an output of a source that has already finished.
+    Sources whose inputs can never be satisfied are skipped. A source that
+    outlives its timeout, or the overall deadline, is abandoned and the lookup
+    carries on with what has landed. Concurrent lookups that need the same
+    source with the same inputs share one upstream call.
+
+    Every declared source is registered; sources can be switched off and on by
+    name at runtime, and select() narrows the enabled ones to a lookup profile.
+    """
+
+    def __init__(self, sources, executor, default_timeout=DEFAULT_SOURCE_TIMEOUT, timeouts=None, disabled=()):
+        self.registry = {source.name: source for source in sources}
+        self.disabled = {source.name for source in sources if not source.enabled}
+        for name in disabled:
+            self.disable(name)
+        self.executor = executor
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.flights = SingleFlight()
+
+    @property
+    def sources(self):
+        return [source for source in self.registry.values() if source.name not in self.disabled]
+
+    def enable(self, name):
+        self._registered(name)
+        self.disabled.discard(name)
+
+    def disable(self, name):
+        self._registered(name)
+        self.disabled.add(name)
+
+    def _registered(self, name):
+        if name not in self.registry:
+            raise ValueError(f"Unknown source: {name}")
+
+    def select(self, profile=DEFAULT_PROFILE):
+        """Enabled sources that fit within profile's cost limit, in run order."""
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}")
+        max_cost = PROFILES[profile]
+        return [source for source in self.sources if max_cost is None or source.cost <= max_cost]
+
+    def describe(self):
+        """Every registered source with its declaration, whether it is enabled and the profiles that run it.
+
+        A profile is only listed when its own sources can supply every input from
+        the plate alone. A source left out of a profile for that reason (e.g.
+        TotalCarCheck under 'fast', where nothing outputs a VIN) still runs there
+        when the input is already stored from an earlier lookup.
+        """
+        return [
+            {
+                **source.describe(),
+                'enabled': source.name not in self.disabled,
+                'profiles': [profile for profile in PROFILES if self._runs_from_plate(source, profile)],
+            }
+            for source in self.registry.values()
+        ]
+
+    def _runs_from_plate(self, source, profile):
+        max_cost = PROFILES[profile]
+        members = [member for member in self.registry.values() if max_cost is None or member.cost <= max_cost]
+        if source not in members:
+            return False
+        available = {'vrm'}
+        while True:
+            grown = available.union(*(member.outputs for member in members if available.issuperset(member.inputs)))
+            if grown == available:
+                return available.issuperset(source.inputs)
+            available = grown
+
+    def timeout_for(self, source):
+        return self.timeouts.get(source.name, source.timeout or self.default_timeout)
+
+    def run(self, context, clients, sources=None, deadline=None):
+        """Generator yielding (name, data) as each source lands; returns (results, statuses).
+
+        deadline is an absolute time.monotonic() value. A source's own timeout is
+        counted from when a worker thread picks it up, not from submission, so
+        sources queued behind others in the shared executor are not cut short.
+        statuses maps each source to
+        {'status': 'ok' | 'error' | 'timeout' | 'skipped', 'latency': seconds}.
+        """
+        context = {name: value for name, value in context.items() if value}
+        waiting = list(self.sources if sources is None else sources)
+        running = {}
+        results = {}
+        statuses = {}
+
+        while True:
+            now = time.monotonic()
+            if deadline is None or now < deadline:
+                for source in [source for source in waiting if all(name in context for name in source.inputs)]:
+                    waiting.remove(source)
+                    inputs = {name: context[name] for name in source.inputs}
+                    clock = {}
+                    future = self.executor.submit(_timed, clock, self._fetch, source, clients, inputs)
+                    running[future] = (source, clock)
+
+            if not running:
+                break
+
+            expiries = [self._expiry(source, clock, deadline) for source, clock in running.values()]
+            next_expiry = min((expires for expires in expiries if expires is not None), default=None)
+            timeout = None if next_expiry is None else max(next_expiry - now, 0)
+            if any('started' not in clock for _, clock in running.values()):
+                timeout = QUEUED_POLL if timeout is None else min(timeout, QUEUED_POLL)
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                source, clock = running.pop(future)
+                latency = round(now - clock.get('started', now), 3)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.write(f"Error in source {source.name}: {str(e)}", is_exception=True)
+                    statuses[source.name] = {'status': 'error', 'error': str(e), 'latency': latency}
+                    continue
+                if not isinstance(data, dict) or 'error' in data:
+                    error = data.get('error') if isinstance(data, dict) else "No data returned"
+                    logger.write(f"Source {source.name} failed: {error}")
+                    statuses[source.name] = {'status': 'error', 'error': error, 'latency': latency}
+                    continue
+
+                results[source.name] = data
+                statuses[source.name] = {'status': 'ok', 'latency': latency}
+                for name, value in source.extract(data).items():
+                    context.setdefault(name, value)
+                yield source.name, data
+
+            for future, (source, clock) in list(running.items()):
+                expires = self._expiry(source, clock, deadline)
+                if expires is not None and now >= expires:
+                    # The worker thread can't be interrupted; its request timeout bounds how long it lingers
+                    future.cancel()
+                    del running[future]
+                    started = clock.get('started', now)
+                    logger.write(f"Source {source.name} timed out after {now - started:.1f}s")
+                    statuses[source.name] = {'status': 'timeout', 'latency': round(now - started, 3)}
+
+        for source in waiting:
+            missing = [name for name in source.inputs if name not in context]
+            if missing:
+                logger.write(f"Skipping source {source.name}, missing inputs: {', '.join(missing)}")
+                statuses[source.name] = {'status': 'skipped', 'missing': missing, 'latency': 0}
+            else:
+                statuses[source.name] = {'status': 'timeout', 'latency': 0}
+        return results, statuses
+
+    def _fetch(self, source, clients, inputs):
+        # Runs in the worker, so a client whose constructor fails only fails its own source
+        client = getattr(clients, source.name, None)
+        return self.flights.do(_flight_key(source, inputs), source.fetch, client=client, **inputs)
+
+    def _expiry(self, source, clock, deadline):
+        # A source still queued for a worker is only bound by the overall deadline
+        expires = deadline
+        if 'started' in clock:
+            own = clock['started'] + self.timeout_for(source)
+            expires = own if expires is None else min(expires, own)
+        return expires
+
+    def extract(self, values):
+        """Canonical values (vin, make, ...) already known from a record's latest values."""
+        known = {}
+        for source in self.registry.values():
+            for name, value in source.extract(values).items():
+                known.setdefault(name, value)
+        return known
+
+    def merge(self, results, sources=None):
+        merged = {}
+        for source in self.sources if sources is None else sources:
+            if source.name not in results:
+                continue
+            if source.key:
+                merged[source.key] = results[source.name]
+            else:
+                merged.update(results[source.name])
+        return merged
+
+def _timed(clock, fn, *args, **kwargs):
+    # Runs in the worker thread, so this marks when the source actually started
+    clock['started'] = time.monotonic()
+    return fn(*args, **kwargs)
+
+def _flight_key(source, inputs):
+    # Inputs compared ignoring case and spacing, so 'ab12 cde' and 'AB12CDE' share a call
+    return (source.name,) + tuple((name, ''.join(str(value).split()).upper()) for name, value in sorted(inputs.items()))
+
+__all__ = ['Source', 'Pipeline', 'load_sources', 'latest_values', 'PROFILES', 'DEFAULT_PROFILE', 'HOUR', 'DAY']
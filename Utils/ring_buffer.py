@@ -0,0 +1,116 @@
+import mmap
+import fcntl
+import struct
+import threading
+from contextlib import contextmanager
+
+# Header: magic, slot count, slot size, head cursor, tail cursor, next request id
+HEADER_FORMAT = '<4sIIIIQ'
+HEADER_SIZE = 32
+SLOT_HEADER_FORMAT = '<QI'
+SLOT_HEADER_SIZE = struct.calcsize(SLOT_HEADER_FORMAT)
+MAGIC = b'VDSQ'
+
+SLOT_COUNT = 128
+SLOT_SIZE = 64
+
+class RingBuffer:
+    """Multi-producer/single-consumer queue of fixed-size slots over a shared mmap.
+
+    Producers and the consumer serialise on an exclusive flock of the backing
+    file, so any number of client processes can push while the service pops.
+    Every pushed entry is stamped with a request ID taken from the header.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'r+b')
+        self.lock = threading.Lock()
+        header = self.file.read(HEADER_SIZE)
+        magic, self.slot_count, self.slot_size, _, _, _ = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a ring buffer")
+        self.size = HEADER_SIZE + self.slot_count * self.slot_size
+        self.shm = mmap.mmap(self.file.fileno(), self.size)
+
+    @staticmethod
+    def create(path, slot_count=SLOT_COUNT, slot_size=SLOT_SIZE):
+        with open(path, 'wb') as f:
+            header = struct.pack(HEADER_FORMAT, MAGIC, slot_count, slot_size, 0, 0, 1)
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            f.write(b'\0' * (slot_count * slot_size))
+
+    @property
+    def payload_size(self):
+        return self.slot_size - SLOT_HEADER_SIZE
+
+    @contextmanager
+    def _locked(self):
+        with self.lock:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def _read_header(self):
+        _, _, _, head, tail, next_id = struct.unpack_from(HEADER_FORMAT, self.shm, 0)
+        return head, tail, next_id
+
+    def _write_header(self, head, tail, next_id):
+        struct.pack_into(HEADER_FORMAT, self.shm, 0, MAGIC, self.slot_count, self.slot_size, head, tail, next_id)
+
+    def _slot_offset(self, cursor):
+        return HEADER_SIZE + (cursor % self.slot_count) * self.slot_size
+
+    def push(self, payload):
+        """Append payload to the queue and return its request ID, or None if the queue is full."""
+        if len(payload) > self.payload_size:
+            raise ValueError(f"Payload of {len(payload)} bytes exceeds slot capacity of {self.payload_size}")
+
+        with self._locked():
+            head, tail, next_id = self._read_header()
+            if (tail - head) % 2**32 >= self.slot_count:
+                return None
+
+            offset = self._slot_offset(tail)
+            struct.pack_into(SLOT_HEADER_FORMAT, self.shm, offset, next_id, len(payload))
+            start = offset + SLOT_HEADER_SIZE
+            self.shm[start:start + len(payload)] = payload
+            self._write_header(head, (tail + 1) % 2**32, next_id + 1)
+            return next_id
+
+    def pop(self):
+        """Remove the oldest entry and return (request_id, payload), or None if the queue is empty."""
+        with self._locked():
+            head, tail, next_id = self._read_header()
+            if head == tail:
+                return None
+
+            offset = self._slot_offset(head)
+            request_id, length = struct.unpack_from(SLOT_HEADER_FORMAT, self.shm, offset)
+            start = offset + SLOT_HEADER_SIZE
+            payload = bytes(self.shm[start:start + length])
+            self.shm[offset:offset + self.slot_size] = b'\0' * self.slot_size
+            self._write_header((head + 1) % 2**32, tail, next_id)
+            return request_id, payload
+
+    def drain(self):
+        entries = []
+        while True:
+            entry = self.pop()
+            if entry is None:
+                return entries
+            entries.append(entry)
+
+    def __len__(self):
+        with self._locked():
+            head, tail, _ = self._read_header()
+            return (tail - head) % 2**32
+
+    def close(self):
+        self.shm.close()
+        self.file.close()
+
+__all__ = ['RingBuffer']
@@ -0,0 +1,21 @@
+import threading
+
+class ThreadLocalSession:
+    """Lazily creates one long-lived HTTP session per thread.
+
+    Connectors hold one of these instead of calling the module-level request
+    functions, so connection pools and TLS sessions survive across lookups.
+    Sessions are per thread because curl handles must not be shared.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.local = threading.local()
+
+    def get(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.factory()
+        return session
+
+__all__ = ['ThreadLocalSession']
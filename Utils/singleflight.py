@@ -0,0 +1,38 @@
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; anyone arriving with the same
+    key while it is in flight waits for that run and gets the same result (or
+    exception). Nothing is cached once the call has finished.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+__all__ = ['SingleFlight']
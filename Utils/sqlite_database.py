@@ -0,0 +1,298 @@
+import json
+import queue
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from Utils.database import Database, _remove_rfr_comments
+from Utils.vrm import normalise_vrm, InvalidVRM
+
+DEFAULT_POOL_SIZE = 8
+# Seconds a writer waits for another process's transaction before giving up
+BUSY_TIMEOUT = 30
+# Record-level timestamps live on the vehicles row rather than in field history
+RECORD_KEYS = ('created_at', 'updated_at')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS vehicles (
+        vrm TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS fields (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vrm TEXT NOT NULL REFERENCES vehicles(vrm) ON DELETE CASCADE,
+        field TEXT NOT NULL,
+        value TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        raw INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS fields_vrm_field ON fields (vrm, field, id);
+    CREATE INDEX IF NOT EXISTS vehicles_updated_at ON vehicles (updated_at);
+'''
+
+class ConnectionPool:
+    """Hands out SQLite connections, reusing up to `size` idle ones across threads."""
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE):
+        self.path = path
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        # Autocommit mode: transactions are opened explicitly with BEGIN
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class SQLiteDatabase:
+    """Vehicle records in SQLite (WAL), with the same write/readReg/delete API as Database.
+
+    Each VRM has a row in vehicles and each field value a row in fields, so a
+    write inserts only the fields whose value changed and never rewrites the
+    rest of the record. WAL lets readers in any process run alongside a writer;
+    writers take the database lock up front (BEGIN IMMEDIATE) and queue on
+    busy_timeout. readReg returns the same shape as the JSON log:
+    {field: [{'value', 'created_at'}, ...], 'created_at', 'updated_at', 'searched'},
+    including fields the log keeps as a bare list (rows flagged raw, see _rows).
+    """
+
+    def __init__(self, file_path=None, pool_size=DEFAULT_POOL_SIZE):
+        self.file_path = Path(file_path) if file_path else Path(__file__).parent / "vehicles.db"
+        self.pool = ConnectionPool(str(self.file_path), pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            # Files created before raw rows existed
+            if 'raw' not in [row[1] for row in conn.execute('PRAGMA table_info(fields)')]:
+                conn.execute('ALTER TABLE fields ADD COLUMN raw INTEGER NOT NULL DEFAULT 0')
+
+    @contextmanager
+    def _transaction(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def write(self, vrm, value):
+        vrm = normalise_vrm(vrm)
+        current_time = datetime.now().isoformat()
+        value = _remove_rfr_comments(value)
+
+        with self.pool.connection() as conn, self._transaction(conn):
+            exists = conn.execute('SELECT 1 FROM vehicles WHERE vrm = ?', (vrm,)).fetchone()
+            rows = []
+            if not exists:
+                conn.execute('INSERT INTO vehicles (vrm, created_at, updated_at) VALUES (?, ?, ?)', (vrm, current_time, current_time))
+                for key, val in value.items():
+                    if key in RECORD_KEYS:
+                        continue
+                    rows.extend((vrm, key, *row) for row in _rows(key, val, current_time))
+            else:
+                latest = self._latest(conn, vrm)
+                for key, val in value.items():
+                    if key in RECORD_KEYS:
+                        continue
+                    # Like the JSON log, a bare list has no latest entry to compare against
+                    if key not in latest or latest[key][1] or latest[key][0] != val:
+                        rows.append((vrm, key, json.dumps(val), current_time, 0))
+                conn.execute('UPDATE vehicles SET updated_at = ? WHERE vrm = ?', (current_time, vrm))
+            conn.executemany('INSERT INTO fields (vrm, field, value, created_at, raw) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def put(self, vrm, value):
+        """Set fields keeping only their newest value; see Database.put."""
+        vrm = normalise_vrm(vrm)
+        current_time = datetime.now().isoformat()
+        keys = [key for key in value if key not in RECORD_KEYS]
+        with self.pool.connection() as conn, self._transaction(conn):
+            conn.execute(
+                'INSERT INTO vehicles (vrm, created_at, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(vrm) DO UPDATE SET updated_at = excluded.updated_at',
+                (vrm, current_time, current_time),
+            )
+            conn.execute(f"DELETE FROM fields WHERE vrm = ? AND field IN ({', '.join('?' * len(keys))})", (vrm, *keys))
+            conn.executemany(
+                'INSERT INTO fields (vrm, field, value, created_at) VALUES (?, ?, ?, ?)',
+                [(vrm, key, json.dumps(value[key]), current_time) for key in keys],
+            )
+
+    def _latest(self, conn, vrm):
+        rows = conn.execute(
+            'SELECT field, value, raw FROM fields WHERE id IN (SELECT MAX(id) FROM fields WHERE vrm = ? GROUP BY field)', (vrm,)
+        )
+        return {field: (json.loads(val), raw) for field, val, raw in rows}
+
+    def readReg(self, vrm):
+        vrm = normalise_vrm(vrm)
+        with self.pool.connection() as conn:
+            # One read transaction so the two queries see the same snapshot
+            conn.execute('BEGIN')
+            try:
+                vehicle = conn.execute('SELECT created_at, updated_at FROM vehicles WHERE vrm = ?', (vrm,)).fetchone()
+                if not vehicle:
+                    return None
+                rows = conn.execute(
+                    'SELECT field, value, created_at, raw FROM fields WHERE vrm = ? ORDER BY id', (vrm,)
+                ).fetchall()
+            finally:
+                conn.execute('COMMIT')
+
+        record = _collect(rows)
+        record['created_at'], record['updated_at'] = vehicle
+        record.setdefault('searched', [])
+        return record
+
+    def read_fields(self, vrm, fields, latest_only=False):
+        """Only the given fields of vrm's record, or None if there is no record; see Database.read_fields."""
+        vrm = normalise_vrm(vrm)
+        fields = list(fields)
+        placeholders = ', '.join('?' * len(fields))
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                vehicle = conn.execute('SELECT created_at, updated_at FROM vehicles WHERE vrm = ?', (vrm,)).fetchone()
+                if not vehicle:
+                    return None
+                if latest_only:
+                    rows = conn.execute(
+                        f'SELECT field, value, created_at, raw FROM fields WHERE id IN '
+                        f'(SELECT MAX(id) FROM fields WHERE vrm = ? AND field IN ({placeholders}) GROUP BY field)',
+                        (vrm, *fields),
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        f'SELECT field, value, created_at, raw FROM fields WHERE vrm = ? AND field IN ({placeholders}) ORDER BY id',
+                        (vrm, *fields),
+                    ).fetchall()
+            finally:
+                conn.execute('COMMIT')
+
+        if latest_only:
+            # A field whose newest row is raw is a bare list with no history entries after it
+            selected = {field: json.loads(val) for field, val, _, _ in rows}
+        else:
+            selected = _collect(rows)
+        record_keys = dict(zip(RECORD_KEYS, vehicle), searched=[])
+        for key, val in record_keys.items():
+            if key in fields and key not in selected:
+                selected[key] = val
+        # In requested order, like the JSON log
+        return {field: selected[field] for field in fields if field in selected}
+
+    def delete(self, vrm):
+        vrm = normalise_vrm(vrm)
+        with self.pool.connection() as conn, self._transaction(conn):
+            conn.execute('DELETE FROM vehicles WHERE vrm = ?', (vrm,))
+
+    def import_record(self, vrm, record):
+        """Store a whole record as read from the JSON log, replacing anything held for vrm."""
+        vrm = normalise_vrm(vrm)
+        created_at = record.get('created_at') or datetime.now().isoformat()
+        updated_at = record.get('updated_at') or created_at
+        rows = []
+        for key, val in record.items():
+            if key in RECORD_KEYS:
+                continue
+            rows.extend((vrm, key, *row) for row in _rows(key, val, updated_at))
+
+        with self.pool.connection() as conn, self._transaction(conn):
+            conn.execute('DELETE FROM vehicles WHERE vrm = ?', (vrm,))
+            conn.execute('INSERT INTO vehicles (vrm, created_at, updated_at) VALUES (?, ?, ?)', (vrm, created_at, updated_at))
+            conn.executemany('INSERT INTO fields (vrm, field, value, created_at, raw) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def close(self):
+        self.pool.close()
+
+def _rows(key, value, created_at):
+    """(value, created_at, raw) rows storing one field as the JSON log holds it.
+
+    A scalar is one history entry. A list is kept item for item: its
+    {'value', 'created_at'} entries become history rows and each run of other
+    items (a bare list such as MOT tests, even an empty one) a raw row holding
+    those items, so readReg gives back the same list. The empty 'searched' list
+    every record starts with is restored on read.
+    """
+    if key == 'searched' and value == []:
+        return []
+    if not isinstance(value, list):
+        return [(json.dumps(value), created_at, 0)]
+    rows = []
+    pending = []
+    for item in value:
+        if isinstance(item, dict) and 'value' in item and 'created_at' in item:
+            if pending:
+                rows.append((json.dumps(pending), created_at, 1))
+                pending = []
+            rows.append((json.dumps(item['value']), item['created_at'], 0))
+        else:
+            pending.append(item)
+    if pending or not rows:
+        rows.append((json.dumps(pending), created_at, 1))
+    return rows
+
+def _collect(rows):
+    # Rebuilds each field's list from (field, value, created_at, raw) rows in id order
+    record = {}
+    for field, val, created_at, raw in rows:
+        if raw:
+            record.setdefault(field, []).extend(json.loads(val))
+        else:
+            record.setdefault(field, []).append({'value': json.loads(val), 'created_at': created_at})
+    return record
+
+def migrate_json(json_path=None, sqlite_path=None):
+    """Copy every live record from a JSON log (db.json) into SQLite; returns how many were copied.
+
+    Safe to re-run: each VRM's rows are replaced, not duplicated.
+    """
+    source = Database(json_path)
+    target = SQLiteDatabase(sqlite_path)
+    migrated = 0
+    for vrm in list(source.index):
+        try:
+            record = source.readReg(vrm)
+            if record is None:
+                continue
+            target.import_record(vrm, record)
+        except InvalidVRM as e:
+            print(f"Skipping record: {e}")
+            continue
+        migrated += 1
+    target.close()
+    return migrated
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate the JSON vehicle log into SQLite")
+    parser.add_argument("--from", dest="json_path", help="JSON log to read (default Utils/db.json)")
+    parser.add_argument("--to", dest="sqlite_path", help="SQLite file to write (default Utils/vehicles.db)")
+    args = parser.parse_args()
+
+    count = migrate_json(args.json_path, args.sqlite_path)
+    print(f"Migrated {count} records.")
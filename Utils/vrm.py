@@ -0,0 +1,26 @@
+import re
+
+# Current (AB12CDE), prefix (A123BCD), suffix (ABC123D) and dateless/Northern Ireland (ABC1234, 1234ABC) plates
+VRM_PATTERN = re.compile(
+    r'^(?:'
+    r'[A-Z]{2}[0-9]{2}[A-Z]{3}'
+    r'|[A-Z][0-9]{1,3}[A-Z]{3}'
+    r'|[A-Z]{3}[0-9]{1,3}[A-Z]'
+    r'|[A-Z]{1,3}[0-9]{1,4}'
+    r'|[0-9]{1,4}[A-Z]{1,3}'
+    r')$'
+)
+
+class InvalidVRM(ValueError):
+    pass
+
+def normalise_vrm(vrm):
+    """Return vrm in canonical form (upper-case, no whitespace), or raise InvalidVRM."""
+    if not isinstance(vrm, str):
+        raise InvalidVRM(f"VRM must be a string, got {type(vrm).__name__}")
+    canonical = ''.join(vrm.split()).upper()
+    if not VRM_PATTERN.match(canonical):
+        raise InvalidVRM(f"Invalid VRM: {vrm!r}")
+    return canonical
+
+__all__ = ['normalise_vrm', 'InvalidVRM']
@@ -1,6 +1,9 @@
 from curl_cffi import requests
 import os
 from dotenv import load_dotenv
+from Utils.sessions import ThreadLocalSession
+
+REQUEST_TIMEOUT = 10
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -26,10 +29,11 @@ class VehicleScoreConnector:
             "cwr_u": os.getenv('VEHICLE_SCORE_CWR_U'),
             "userId": os.getenv('VEHICLE_SCORE_USER_ID'),
         }
+        self.sessions = ThreadLocalSession(requests.Session)
 
     def fetch_data(self, registration):
         url = f"{self.base_url}?registration={registration}"
-        response = requests.get(url, headers=self.headers, cookies=self.cookies)
+        response = self.sessions.get().get(url, headers=self.headers, cookies=self.cookies, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         return response.json()
 
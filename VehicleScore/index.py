@@ -1,13 +1,15 @@
 from .connections import VehicleScoreConnector
 from Utils.utils import flatten_dict
 from Utils.logging import logger
+from Utils.pipeline import Source, DAY
+from Utils.vrm import normalise_vrm
 
-def get_vehicle_score(vrm):
+def get_vehicle_score(vrm, client=None):
+    vrm = normalise_vrm(vrm)
     try:
-        score_api = VehicleScoreConnector()
+        score_api = client or VehicleScoreConnector()
         api_response = score_api.fetch_data(vrm)
 
-        print(api_response)
         if api_response and 'pageProps' in api_response:
             if 'mot' in api_response['pageProps']:
                 if 'motTests' in api_response['pageProps']['mot']:
@@ -20,4 +22,15 @@ def get_vehicle_score(vrm):
     except Exception as e:
         logger.write(str(e), is_exception=True)
 
+SOURCE = Source(
+    'vehiclescore',
+    get_vehicle_score,
+    inputs=('vrm',),
+    outputs={'make': 'pageProps_vehicle_make', 'model': 'pageProps_vehicle_model', 'year': 'pageProps_vehicle_year'},
+    client=VehicleScoreConnector,
+    ttl=DAY,
+    cost=1,
+    latency=1,
+)
+
 __all__ = ['get_vehicle_score']
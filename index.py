@@ -5,34 +5,94 @@ import signal
 import sys
 import os
 import mmap
+import math
+import fcntl
+import struct
+import shutil
+import socket
+import selectors
+import contextlib
 from multiprocessing import Process
-from collections import deque
+from queue import SimpleQueue
+from concurrent.futures import ThreadPoolExecutor
 
-from interface import VehicleDataInterface, get_mot_history
-from Utils.database import Database
+from interface import VehicleDataInterface, SourceClients, DEFAULT_DEADLINE, DEFAULT_AI_TIMEOUT
+from Utils.database import get_database
+from Utils.pipeline import PROFILES, DEFAULT_PROFILE
 from Utils.logging import logger
+from Utils.ring_buffer import RingBuffer
+from Utils.vrm import normalise_vrm, InvalidVRM
 
-PID_FILE = '/tmp/vehicle_data_service.pid'
+LOCK_FILE = '/tmp/vehicle_data_service.lock'
 SHM_FILE = '/tmp/vehicle_data_service_queue.shm'
-SHM_SIZE = 1024 * 10
+RESULT_DIR = '/tmp/vehicle_data_service_results'
+SOCKET_FILE = '/tmp/vehicle_data_service.sock'
+# Result files carry a length prefix and are sized to their payload
+RESULT_HEADER_FORMAT = '<Q'
+RESULT_HEADER_SIZE = struct.calcsize(RESULT_HEADER_FORMAT)
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 32
+DEFAULT_DRAIN_TIMEOUT = 60
+# Seconds a finished request's outcome and result file wait for a client to collect them
+RESULT_TTL = 600
+SWEEP_INTERVAL = 60
+FINAL_EVENTS = ('done', 'error', 'rejected')
+
+def result_path(request_id):
+    return os.path.join(RESULT_DIR, f"{request_id}.shm")
 
 class VehicleDataService:
-    def __init__(self):
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, drain_timeout=DEFAULT_DRAIN_TIMEOUT, profile=DEFAULT_PROFILE,
+                 deadline=DEFAULT_DEADLINE, ai_timeout=DEFAULT_AI_TIMEOUT):
         try:
-            self.interface = VehicleDataInterface(Database())
+            self.state = 'starting'
+            self.closed = False
+            # Source clients live as long as the service so every request reuses their sessions
+            self.clients = SourceClients()
+            self.interface = VehicleDataInterface(get_database(), self.clients, deadline=deadline, profile=profile, ai_timeout=ai_timeout)
             self.running = False
-            self.shm_file = open(SHM_FILE, 'r+b')
-            self.shm = mmap.mmap(self.shm_file.fileno(), SHM_SIZE)
-            self.queue = deque()
+            self.workers = workers
+            self.max_pending = max_pending
+            self.drain_timeout = drain_timeout
+            self.drain_deadline = None
+            self.abandoned = False
+            self.active = {}
+            self.avg_lookup_seconds = None
+            self.requests = RingBuffer(SHM_FILE)
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vrm-worker')
+            self.completions = SimpleQueue()
+            self.waiters = {}
+            self.outcomes = {}
+            self.next_sweep = time.monotonic() + SWEEP_INTERVAL
+            self.selector = selectors.DefaultSelector()
+            self.listener = self.open_listener()
+            self.selector.register(self.listener, selectors.EVENT_READ)
+            # Workers never touch client sockets; they hand completions back to the selector loop
+            self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+            self.wakeup_reader.setblocking(False)
+            self.wakeup_writer.setblocking(False)
+            self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
         except Exception as e:
             logger.write(f"Error in VehicleDataService.__init__: {str(e)}", is_exception=True)
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        if getattr(self, 'closed', True):
+            return
+        self.closed = True
         try:
-            self.shm.close()
-            self.shm_file.close()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.requests.close()
+            self.selector.close()
+            self.listener.close()
+            self.wakeup_reader.close()
+            self.wakeup_writer.close()
+            if os.path.exists(SOCKET_FILE):
+                os.remove(SOCKET_FILE)
         except Exception as e:
-            logger.write(f"Error in VehicleDataService.__del__: {str(e)}", is_exception=True)
+            logger.write(f"Error in VehicleDataService.close: {str(e)}", is_exception=True)
 
     def get_vehicle_data(self, vrm):
         try:
@@ -41,12 +101,39 @@ class VehicleDataService:
             logger.write(f"Error in get_vehicle_data for VRM {vrm}: {str(e)}", is_exception=True)
             return None
 
+    def open_listener(self):
+        if os.path.exists(SOCKET_FILE):
+            os.remove(SOCKET_FILE)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(SOCKET_FILE)
+        listener.listen()
+        return listener
+
     def start(self):
         try:
             self.running = True
-            signal.signal(signal.SIGUSR1, self.handle_signal)
+            signal.signal(signal.SIGTERM, self.handle_signal)
+            self.state = 'ready'
             while self.running:
-                time.sleep(0.1)
+                timeout = max(self.next_sweep - time.monotonic(), 0)
+                if self.drain_deadline is not None:
+                    timeout = min(timeout, max(self.drain_deadline - time.monotonic(), 0))
+
+                # Block until a client connects or writes; every client message doubles as a doorbell
+                for key, _ in self.selector.select(timeout):
+                    if key.fileobj is self.listener:
+                        self.accept_client()
+                    elif key.fileobj is self.wakeup_reader:
+                        self.handle_completions()
+                    else:
+                        self.read_client(key.fileobj)
+                self.process_queue()
+                if time.monotonic() >= self.next_sweep:
+                    self.sweep_results()
+
+                if self.state == 'draining':
+                    self.check_drained()
+            self.state = 'stopped'
         except Exception as e:
             logger.write(f"Error in start: {str(e)}", is_exception=True)
 
@@ -58,35 +145,194 @@ class VehicleDataService:
 
     def handle_signal(self, signum, frame):
         try:
-            self.process_queue()
+            self.begin_drain()
         except Exception as e:
             logger.write(f"Error in handle_signal: {str(e)}", is_exception=True)
 
-    def process_queue(self):
+    def begin_drain(self):
+        # Stop taking new work, but let in-flight lookups finish their writes
+        if self.state == 'draining':
+            return
+        self.state = 'draining'
+        self.drain_deadline = time.monotonic() + self.drain_timeout
+        logger.write(f"Draining {len(self.active)} requests, deadline {self.drain_timeout}s")
+        self.wake()
+
+    def check_drained(self):
+        if not self.active:
+            self.stop()
+        elif time.monotonic() >= self.drain_deadline:
+            for request_id, future in list(self.active.items()):
+                del self.active[request_id]
+                if future.cancel():
+                    self.notify(request_id, 'error', error="Service shut down before the request started")
+                else:
+                    self.abandoned = True
+                    self.notify(request_id, 'error', error="Service shut down before the lookup finished")
+            if self.abandoned:
+                logger.write("Drain deadline passed with lookups still running")
+            self.stop()
+
+    def sweep_results(self):
+        # Clients that vanished before collecting their request leave its outcome and result file behind
+        self.next_sweep = time.monotonic() + SWEEP_INTERVAL
         try:
-            self.shm.seek(0)
-            queue_data = self.shm.read().decode().strip('\0')
-            if queue_data:
-                vrm = queue_data
-                self.clear_shared_memory()
-                if vrm:
-                    self.process_vrm(vrm)
+            now = time.monotonic()
+            for request_id in [rid for rid, (_, _, expires) in self.outcomes.items() if expires <= now]:
+                del self.outcomes[request_id]
+            cutoff = time.time() - RESULT_TTL
+            with os.scandir(RESULT_DIR) as entries:
+                for entry in entries:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            logger.write(f"Error in process_queue: {str(e)}", is_exception=True)
+            logger.write(f"Error in sweep_results: {str(e)}", is_exception=True)
 
-    def clear_shared_memory(self):
+    def status(self):
+        return {
+            'state': self.state,
+            'active': len(self.active),
+            'max_pending': self.max_pending,
+            'workers': self.workers,
+            'avg_lookup_seconds': self.avg_lookup_seconds,
+        }
+
+    def estimate_wait(self, ahead):
+        # Requests ahead of this one run `workers` at a time at the observed average pace
+        if self.avg_lookup_seconds is None:
+            return None
+        return round(math.ceil((ahead + 1) / self.workers) * self.avg_lookup_seconds, 1)
+
+    def accept_client(self):
         try:
-            self.shm.seek(0)
-            self.shm.write(b'\0' * SHM_SIZE)
+            conn, _ = self.listener.accept()
+            self.selector.register(conn, selectors.EVENT_READ)
         except Exception as e:
-            logger.write(f"Error in clear_shared_memory: {str(e)}", is_exception=True)
+            logger.write(f"Error in accept_client: {str(e)}", is_exception=True)
+
+    def read_client(self, conn):
+        try:
+            data = conn.recv(4096)
+            if not data:
+                self.drop_client(conn)
+                return
+            for line in data.splitlines():
+                message = json.loads(line)
+                op = message.get('op')
+                if op == 'wait':
+                    self.add_waiter(message['id'], conn)
+                elif op == 'status':
+                    self.reply(conn, {'event': 'status', **self.status()})
+                elif op == 'stop':
+                    self.begin_drain()
+                    self.reply(conn, {'event': 'stopping', 'drain_timeout': self.drain_timeout})
+        except Exception as e:
+            logger.write(f"Error in read_client: {str(e)}", is_exception=True)
+            self.drop_client(conn)
+
+    def drop_client(self, conn):
+        try:
+            self.selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+        for request_id in [rid for rid, waiter in self.waiters.items() if waiter is conn]:
+            del self.waiters[request_id]
+        conn.close()
+
+    def add_waiter(self, request_id, conn):
+        self.waiters[request_id] = conn
+        # The request may already have finished if another client's doorbell drained it
+        if request_id in self.outcomes:
+            event, fields, _ = self.outcomes.pop(request_id)
+            self.notify(request_id, event, **fields)
 
-    def process_vrm(self, vrm):
+    def reply(self, conn, message):
         try:
+            conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        except OSError as e:
+            logger.write(f"Client went away: {str(e)}")
+        self.drop_client(conn)
+
+    def notify(self, request_id, event, **fields):
+        final = event in FINAL_EVENTS
+        conn = self.waiters.pop(request_id, None) if final else self.waiters.get(request_id)
+        if conn is None:
+            # Progress events are only useful live; final outcomes wait for their client
+            if final:
+                self.outcomes[request_id] = (event, fields, time.monotonic() + RESULT_TTL)
+            return
+        if final:
+            self.reply(conn, {'event': event, 'id': request_id, **fields})
+            return
+        try:
+            conn.sendall(json.dumps({'event': event, 'id': request_id, **fields}).encode('utf-8') + b'\n')
+        except OSError as e:
+            logger.write(f"Client for request {request_id} went away: {str(e)}")
+            self.drop_client(conn)
+
+    def wake(self):
+        try:
+            self.wakeup_writer.send(b'\0')
+        except BlockingIOError:
+            pass  # The loop already has a wakeup pending
+
+    def complete(self, request_id, event, **fields):
+        self.completions.put((request_id, event, fields))
+        self.wake()
+
+    def handle_completions(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.completions.empty():
+            request_id, event, fields = self.completions.get()
+            self.active.pop(request_id, None)
+            elapsed = fields.get('elapsed')
+            if elapsed is not None:
+                if self.avg_lookup_seconds is None:
+                    self.avg_lookup_seconds = elapsed
+                else:
+                    self.avg_lookup_seconds = round(0.8 * self.avg_lookup_seconds + 0.2 * elapsed, 3)
+            self.notify(request_id, event, **fields)
+
+    def process_queue(self):
+        try:
+            # A single doorbell may stand for several enqueued requests
+            for request_id, payload in self.requests.drain():
+                vrm = payload.decode('utf-8')
+                if not vrm:
+                    continue
+                try:
+                    vrm = normalise_vrm(vrm)
+                except InvalidVRM as e:
+                    self.notify(request_id, 'rejected', error=str(e))
+                    continue
+                if self.state != 'ready':
+                    self.notify(request_id, 'rejected', error=f"Service is {self.state}")
+                elif len(self.active) >= self.max_pending:
+                    self.notify(request_id, 'rejected', error="Service is at capacity",
+                                retry_after=self.estimate_wait(len(self.active) - self.workers))
+                else:
+                    ahead = len(self.active)
+                    self.active[request_id] = self.executor.submit(self.process_vrm, request_id, vrm)
+                    self.notify(request_id, 'queued', position=ahead, eta=self.estimate_wait(ahead))
+        except Exception as e:
+            logger.write(f"Error in process_queue: {str(e)}", is_exception=True)
+
+    def process_vrm(self, request_id, vrm):
+        started = time.monotonic()
+        try:
+            logger.write(f"Processing request {request_id} for VRM {vrm}")
             result = self.process_single_vrm(vrm)
-            self.save_result(result)
+            self.save_result(request_id, result)
+            self.complete(request_id, 'done', elapsed=round(time.monotonic() - started, 3))
         except Exception as e:
             logger.write(f"Error processing VRM {vrm}: {str(e)}", is_exception=True)
+            self.complete(request_id, 'error', error=str(e), elapsed=round(time.monotonic() - started, 3))
 
     def process_single_vrm(self, vrm):
         try:
@@ -94,106 +340,228 @@ class VehicleDataService:
             if vehicle_data is None:
                 raise ValueError(f"No data found for VRM: {vrm}")
             
-            # The get_vehicle_data method now returns the complete result including AI analysis
-            result = f"VRM: {vrm}\n{vehicle_data}"
-            
-            # Write the result to the shared memory
-            self.save_result(result)
+            # The get_vehicle_data method returns the complete result including AI analysis
+            result = json.dumps(vehicle_data)
             
             return result
         except Exception as e:
-            logger.error(f"Error in process_single_vrm for {vrm}: {str(e)}")
+            logger.write(f"Error in process_single_vrm for {vrm}: {str(e)}", is_exception=True)
             raise
 
-    def save_result(self, result):
+    def save_result(self, request_id, result):
         try:
-            self.shm.seek(0)
             encoded_result = result.encode('utf-8')
-            if len(encoded_result) > SHM_SIZE:
-                encoded_result = encoded_result[:SHM_SIZE]
-            self.shm.write(encoded_result)
-            self.shm.write(b'\0' * (SHM_SIZE - len(encoded_result)))  # Pad with null bytes
+            size = RESULT_HEADER_SIZE + len(encoded_result)
+
+            # Write the whole region under a temporary name and rename it into place,
+            # so the waiting client never maps a half-written result
+            path = result_path(request_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w+b') as f:
+                f.truncate(size)
+                shm = mmap.mmap(f.fileno(), size)
+                struct.pack_into(RESULT_HEADER_FORMAT, shm, 0, len(encoded_result))
+                shm[RESULT_HEADER_SIZE:size] = encoded_result
+                shm.close()
+            os.replace(tmp_path, path)
         except Exception as e:
             logger.write(f"Error in save_result: {str(e)}", is_exception=True)
+            raise
+
+def acquire_service_lock():
+    # The running service holds an exclusive flock on LOCK_FILE for its whole life;
+    # the kernel drops it when the process dies, so there is no stale PID to trust
+    lock = open(LOCK_FILE, 'a+')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    lock.seek(0)
+    lock.truncate()
+    lock.write(str(os.getpid()))
+    lock.flush()
+    return lock
 
 def is_service_running():
     try:
-        if os.path.exists(PID_FILE):
-            with open(PID_FILE, 'r') as f:
-                pid = int(f.read().strip())
+        if not os.path.exists(LOCK_FILE):
+            return False
+        with open(LOCK_FILE, 'r') as lock:
             try:
-                os.kill(pid, 0)
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
                 return True
-            except OSError:
-                return False
-        return False
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            return False
     except Exception as e:
         logger.write(f"Error in is_service_running: {str(e)}", is_exception=True)
         return False
 
-def run_service():
+def wait_for_exit(timeout):
+    deadline = time.monotonic() + timeout
+    while is_service_running():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+def ensure_request_queue():
+    # Only the lock holder may (re)create the queue: entries already pushed and
+    # the request ID counter survive a restart
+    try:
+        RingBuffer(SHM_FILE).close()
+    except (OSError, ValueError, struct.error):
+        RingBuffer.create(SHM_FILE)
+
+def run_service(workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, drain_timeout=DEFAULT_DRAIN_TIMEOUT, profile=DEFAULT_PROFILE,
+                deadline=DEFAULT_DEADLINE, ai_timeout=DEFAULT_AI_TIMEOUT):
+    lock = acquire_service_lock()
+    if lock is None:
+        logger.write("Service is already running.")
+        return
     try:
-        service = VehicleDataService()
-        with open(PID_FILE, 'w') as f:
-            f.write(str(os.getpid()))
+        ensure_request_queue()
+        service = VehicleDataService(workers, max_pending, drain_timeout, profile, deadline, ai_timeout)
         service.start()
-        os.remove(PID_FILE)
+        service.close()
+        if os.path.exists(SHM_FILE):
+            os.remove(SHM_FILE)
+        if service.abandoned:
+            # Abandoned lookups are still running in worker threads and would go on writing
+            # results; end the process here so the lock is only released once they are gone
+            sys.stdout.flush()
+            os._exit(1)
     except Exception as e:
         logger.write(f"Error in run_service: {str(e)}", is_exception=True)
+    finally:
+        lock.close()
+
+def request_service(message, timeout=10):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(SOCKET_FILE)
+        conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        line = conn.makefile('rb').readline()
+    return json.loads(line) if line else {}
 
 def send_command_to_service(command, vrm=None):
     try:
         if command == 'stop':
-            os.kill(int(open(PID_FILE, 'r').read().strip()), signal.SIGTERM)
+            try:
+                request_service({'op': 'stop'})
+            except (FileNotFoundError, ConnectionRefusedError):
+                with open(LOCK_FILE, 'r') as f:
+                    os.kill(int(f.read().strip()), signal.SIGTERM)
+        elif command == 'status':
+            return request_service({'op': 'status'})
         elif command == 'add_vrm':
-            with open(SHM_FILE, 'r+b') as f:
-                shm = mmap.mmap(f.fileno(), SHM_SIZE)
-                new_data = vrm.encode()
-                
-                if len(new_data) > SHM_SIZE:
-                    new_data = new_data[:SHM_SIZE]
-                
-                shm.seek(0)
-                shm.write(b'\0' * SHM_SIZE)
-                shm.seek(0)
-                shm.write(new_data)
-                shm.close()
-            
-            with open(PID_FILE, 'r') as f:
-                pid = int(f.read().strip())
-            os.kill(pid, signal.SIGUSR1)
+            requests = RingBuffer(SHM_FILE)
+            try:
+                request_id = requests.push(vrm.encode('utf-8'))
+            finally:
+                requests.close()
+
+            if request_id is None:
+                raise RuntimeError(f"Request queue is full, could not enqueue VRM {vrm}")
+            return request_id
     except Exception as e:
         logger.write(f"Error in send_command_to_service: {str(e)}", is_exception=True)
 
-def get_result(vrm):
+def wait_for_service(timeout=10):
+    # The socket is bound before the service's loop runs, so poll until it reports ready
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if request_service({'op': 'status'}, timeout=max(deadline - time.monotonic(), 0.05)).get('state') == 'ready':
+                return True
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+            pass
+        time.sleep(0.05)
+    return False
+
+def wait_for_result(request_id, timeout):
+    # Subscribing also rings the service's doorbell, so it drains the queue straight away
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(SOCKET_FILE)
+        conn.sendall(json.dumps({'op': 'wait', 'id': request_id}).encode('utf-8') + b'\n')
+        message = {}
+        for line in conn.makefile('rb'):
+            message = json.loads(line)
+            if message.get('event') != 'queued':
+                break
+            eta = message.get('eta')
+            print(f"Queued behind {message.get('position')} requests" + (f", ETA {eta}s" if eta is not None else ""), file=sys.stderr)
+
+    if message.get('event') not in FINAL_EVENTS:
+        raise RuntimeError(f"Service closed the connection before request {request_id} finished")
+
+    if message.get('event') == 'rejected':
+        retry_after = message.get('retry_after')
+        raise RuntimeError(message.get('error') + (f", retry in {retry_after}s" if retry_after is not None else ""))
+    if message.get('event') == 'error':
+        raise RuntimeError(message.get('error'))
+    return get_result(request_id)
+
+def get_result(request_id):
     try:
-        if os.path.exists(RESULT_FILE):
-            with open(RESULT_FILE, 'r') as f:
-                result = json.load(f)
-                if vrm in result:
-                    return result[vrm]
-        return None
+        path = result_path(request_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            shm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            (length,) = struct.unpack_from(RESULT_HEADER_FORMAT, shm, 0)
+            with memoryview(shm) as view:
+                result = str(view[RESULT_HEADER_SIZE:RESULT_HEADER_SIZE + length], 'utf-8')
+            shm.close()
+        os.remove(path)
+        return result
     except Exception as e:
-        logger.write(f"Error in get_result for VRM {vrm}: {str(e)}", is_exception=True)
+        logger.write(f"Error in get_result for request {request_id}: {str(e)}", is_exception=True)
         return None
 
+def run_batch(source, workers, profile=DEFAULT_PROFILE, deadline=DEFAULT_DEADLINE, ai_timeout=DEFAULT_AI_TIMEOUT):
+    stream = sys.stdin if source == '-' else open(source, 'r')
+    with stream:
+        vrms = [line.strip() for line in stream if line.strip() and not line.lstrip().startswith('#')]
+
+    # Keep stdout clean for the JSONL results; progress logging goes to stderr
+    output = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        interface = VehicleDataInterface(get_database(), deadline=deadline, profile=profile, ai_timeout=ai_timeout)
+        for entry in interface.get_vehicle_data_batch(vrms, workers):
+            output.write(json.dumps(entry) + '\n')
+            output.flush()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Vehicle Data Service")
     parser.add_argument("--start", action="store_true", help="Start the service")
-    parser.add_argument("--stop", action="store_true", help="Stop the service")
+    parser.add_argument("--stop", action="store_true", help="Stop the service after draining in-flight lookups")
+    parser.add_argument("--status", action="store_true", help="Show the service's readiness and load")
     parser.add_argument("--vrm", help="Process a single VRM")
+    parser.add_argument("--batch", metavar="FILE", help="Process VRMs listed one per line in FILE (- for stdin), printing JSONL results")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of lookups run in parallel by the service or a batch")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING, help="Requests the service admits before rejecting new ones")
+    parser.add_argument("--drain-timeout", type=int, default=DEFAULT_DRAIN_TIMEOUT, help="Seconds --stop waits for in-flight lookups")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE, help="Sources the service or a batch runs: fast, standard or full")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE, help="Seconds a lookup waits for its sources (0 for no limit)")
+    parser.add_argument("--ai-timeout", type=float, default=DEFAULT_AI_TIMEOUT, help="Seconds a lookup waits for the AI report (0 for no limit)")
     args = parser.parse_args()
 
     def start_service():
         if not is_service_running():
-            with open(SHM_FILE, 'wb') as f:
-                f.write(b'\0' * SHM_SIZE)
-            process = Process(target=run_service)
+            os.makedirs(RESULT_DIR, exist_ok=True)
+            process = Process(target=run_service, args=(args.workers, args.max_pending, args.drain_timeout, args.profile, args.deadline, args.ai_timeout))
             process.start()
-            time.sleep(2)
-            print("Service started successfully.")
+            message = "Service started successfully."
         else:
-            print("Service is already running.")
+            message = "Service is already running."
+        # Another caller may have just started it, so wait for it to be ready either way
+        if wait_for_service():
+            print(message)
+        else:
+            print("Service did not start in time.")
 
     try:
         if args.start:
@@ -201,42 +569,41 @@ if __name__ == "__main__":
         elif args.stop:
             if is_service_running():
                 send_command_to_service('stop')
-                try:
-                    os.remove(SHM_FILE)
-                except FileNotFoundError:
-                    pass
-                print("Service stopped successfully.")
+                if wait_for_exit(args.drain_timeout + 5):
+                    shutil.rmtree(RESULT_DIR, ignore_errors=True)
+                    print("Service stopped successfully.")
+                else:
+                    print("Service is still draining.")
             else:
                 print("Service is not running.")
+        elif args.status:
+            if is_service_running():
+                print(json.dumps(send_command_to_service('status')))
+            else:
+                print(json.dumps({'state': 'stopped'}))
+        elif args.batch:
+            run_batch(args.batch, args.workers, args.profile, args.deadline, args.ai_timeout)
         elif args.vrm:
+            # Reject junk before starting the service or touching the queue
+            args.vrm = normalise_vrm(args.vrm)
             start_service()  # This will start the service only if it's not already running
 
-            send_command_to_service('add_vrm', args.vrm)
+            request_id = send_command_to_service('add_vrm', args.vrm)
+            if request_id is None:
+                raise RuntimeError(f"Failed to enqueue VRM {args.vrm}")
 
             max_wait = 360  # 6 minutes
-            result = None
-            for i in range(max_wait):
-                with open(SHM_FILE, 'r+b') as f:
-                    shm = mmap.mmap(f.fileno(), SHM_SIZE)
-                    result = shm.read().decode('utf-8').strip('\0')
-                    shm.close()
-                if result:
-                    break
-                time.sleep(1)
+            try:
+                result = wait_for_result(request_id, max_wait)
+            except socket.timeout:
+                result = None
 
             if not result:
                 error_message = f"Timeout waiting for result for VRM {args.vrm}"
-                logger.error(error_message)
+                logger.write(error_message)
                 print(json.dumps({"error": error_message}))
             else:
-                print(json.dumps({"result": result}))
-            
-            # Clear the shared memory after reading the result
-            with open(SHM_FILE, 'r+b') as f:
-                shm = mmap.mmap(f.fileno(), SHM_SIZE)
-                shm.seek(0)
-                shm.write(b'\0' * SHM_SIZE)
-                shm.close()
+                print(json.dumps({"result": json.loads(result)}))
 
         else:
             parser.print_help()
@@ -252,7 +619,4 @@ if __name__ == "__main__":
 
     except Exception as e:
         logger.write(f"Error in main execution: {str(e)}", is_exception=True)
-        print(json.dumps({"error": str(e)}))
-    finally:
-        if args.stop and os.path.exists(SHM_FILE):
-            os.remove(SHM_FILE)
\ No newline at end of file
+        print(json.dumps({"error": str(e)}))
\ No newline at end of file
@@ -1,123 +1,378 @@
 from datetime import datetime, timedelta
 import json
+import time
+import threading
 import logging
-from CarGuide.index import get_car_details
-from VehicleScore.index import get_vehicle_score
-from Carly.index import get_carly_vehicle_history
-from TotalCarCheck.index import get_total_car_check
-from AutoTrader.index import get_autotrader_listings
-from DVSA.index import get_mot_history
-from Utils.database import Database
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Utils.database import get_database, meta_store_for
+from Utils.pipeline import Pipeline, load_sources, latest_values, PROFILES, DEFAULT_PROFILE
+from Utils.singleflight import SingleFlight
+from Utils.vrm import normalise_vrm, InvalidVRM
+from Models.mapping import build_vehicle_model, vehicle_model_dict
 from AI.index import AI
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+DEFAULT_BATCH_WORKERS = 4
+SOURCE_WORKERS = 16
+# Seconds the whole source fan-out may take before a lookup settles for what has landed
+DEFAULT_DEADLINE = 30
+# Seconds the Gemini request for the report may take, on top of the source deadline
+DEFAULT_AI_TIMEOUT = 180
+REFRESH_WORKERS = 2
+# Kept in the meta store, overwritten on each lookup, so stale-while-revalidate can serve the last report
+AI_FIELD = 'ai_analysis'
+AI_AT_FIELD = 'ai_analysis_at'
+
+class SourceClients:
+    """Long-lived, pre-configured clients for every upstream source.
+
+    Shared by every lookup (and every interface handed the same instance), so
+    headers, sessions, tokens and the Gemini model are set up once. A source's
+    client is built the first time a lookup runs it, so sources outside the
+    profiles in use never touch their credentials.
+    """
+
+    def __init__(self):
+        self.factories = {source.name: source.client for source in load_sources() if source.client}
+        self.lock = threading.Lock()
+        self.ai = AI()
+        logger.info("SourceClients initialized")
+
+    def __getattr__(self, name):
+        # Only reached for clients that have not been built yet
+        factories = self.__dict__.get('factories', {})
+        if name not in factories:
+            raise AttributeError(name)
+        with self.lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = factories[name]()
+                logger.info(f"Client for {name} initialized")
+        return self.__dict__[name]
+
 class VehicleDataInterface:
-    def __init__(self, database):
+    def __init__(self, database, clients=None, deadline=DEFAULT_DEADLINE, source_timeouts=None, stale_while_revalidate=False,
+                 profile=DEFAULT_PROFILE, disabled_sources=(), meta=None, ai_timeout=DEFAULT_AI_TIMEOUT):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}")
         self.db = database
-        self.ai = AI()
+        # Per-lookup data (AI report, fetch markers) that must not pile up in the vehicle record's history
+        self.meta = meta if meta is not None else meta_store_for(database)
+        self.clients = clients or SourceClients()
+        self.ai = self.clients.ai
+        self.deadline = deadline
+        self.ai_timeout = ai_timeout
+        self.stale_while_revalidate = stale_while_revalidate
+        self.executor = ThreadPoolExecutor(max_workers=SOURCE_WORKERS, thread_name_prefix='source-fetch')
+        self.pipeline = Pipeline(load_sources(), self.executor, timeouts=source_timeouts, disabled=disabled_sources)
+        self.profile = profile
+        self.refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='swr-refresh')
+        self.lookups = SingleFlight()
+        self.refreshing = set()
+        self.refresh_lock = threading.Lock()
         logger.info("VehicleDataInterface initialized")
 
-    def get_vehicle_data(self, vrm):
-        logger.info(f"Processing VRM: {vrm}")
-        existing_data = self.db.readReg(vrm)
-        logger.info(f"Existing data for {vrm}: {json.dumps(existing_data)}")
-        mot_history = get_mot_history(vrm)
-        logger.info(f"MOT history for {vrm}: {json.dumps(mot_history)}")
+    def get_vehicle_data(self, vrm, profile=None):
+        """Look up vrm and return {'vrm', 'profile', 'vehicle_data', 'sources', 'ai_analysis'}.
 
-        if existing_data:
-            combined_data = {**existing_data, 'mot_history': mot_history}
-            logger.info(f"Combined existing data for {vrm}: {json.dumps(combined_data)}")
-        else:
-            logger.info(f"No existing data found for {vrm}. Fetching new data.")
-            vehicle_data = self._fetch_all_vehicle_data(vrm)
-            logger.info(f"Fetched vehicle data for {vrm}: {json.dumps(vehicle_data)}")
-            self.db.write(vrm, vehicle_data)
-            logger.info(f"Wrote new data to DB for {vrm}")
-            combined_data = {**vehicle_data, 'mot_history': mot_history}
-            logger.info(f"Combined new data for {vrm}: {json.dumps(combined_data)}")
-
-        ai_analysis = self._process_with_ai(combined_data)
-        logger.info(f"AI analysis for {vrm}: {json.dumps(ai_analysis)}")
-
-        return ai_analysis
-
-    def _print_data_info(self, data, data_name):
-        if isinstance(data, dict):
-            logger.info(f"Number of key-value pairs in {data_name}: {len(data)}")
-        else:
-            logger.info(f"{data_name} is not a dict")
+        vehicle_data is the canonical VehicleDataModel as a dict, resolved from
+        every source's raw fields (see Models.mapping). profile picks which
+        sources may go upstream (see Utils.pipeline.PROFILES), defaulting to the
+        interface's own; 'fast' trades depth for latency.
 
-    def _fetch_all_vehicle_data(self, vrm):
-        vehicle_data = {}
+        Sources still outstanding when the deadline passes are left out of
+        vehicle_data; the AI report has its own ai_timeout, and if it fails the
+        stored report (if any) is returned. 'sources' reports each one's status
+        and latency. In stale-while-revalidate mode a stored record is returned
+        straight away, see _get_cached_vehicle_data. Concurrent calls for the
+        same plate share one lookup and receive the same result. Raises
+        InvalidVRM for anything that is not a plate, before any upstream call.
+        """
+        vrm = normalise_vrm(vrm)
+        profile = self._profile(profile)
+        if self.stale_while_revalidate:
+            cached = self._get_cached_vehicle_data(vrm, profile)
+            if cached is not None:
+                return cached
 
-        logger.info(f"Calling get_car_details for {vrm}")
-        car_details = get_car_details(vrm)
-        if isinstance(car_details, dict):
-            vehicle_data.update(car_details)
-            logger.info(f"Car details for {vrm}: {json.dumps(car_details)}")
-        else:
-            logger.warning(f"get_car_details did not return a dict for {vrm}")
+        return self.lookups.do((vrm, profile), self._lookup, vrm, profile)
 
-        logger.info(f"Calling get_vehicle_score for {vrm}")
-        vehicle_score = get_vehicle_score(vrm)
-        if isinstance(vehicle_score, dict):
-            vehicle_data.update(vehicle_score)
-            logger.info(f"Vehicle score for {vrm}: {json.dumps(vehicle_score)}")
-        else:
-            logger.warning(f"get_vehicle_score did not return a dict for {vrm}")
+    def _deadline(self):
+        return time.monotonic() + self.deadline if self.deadline else None
+
+    def _profile(self, profile):
+        profile = profile or self.profile
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}")
+        return profile
 
-        logger.info(f"Calling get_carly_vehicle_history for {vrm}")
-        carly_history = get_carly_vehicle_history(vrm)
-        if isinstance(carly_history, dict):
-            vehicle_data.update(carly_history)
-            logger.info(f"Carly vehicle history for {vrm}: {json.dumps(carly_history)}")
+    def _lookup(self, vrm, profile):
+        deadline = self._deadline()
+        combined_data, statuses, meta = _run_to_completion(self._iter_combined_data(vrm, profile, deadline))
+
+        vehicle = build_vehicle_model(latest_values(combined_data))
+        ai_analysis = meta.get(AI_FIELD)
+        if ai_analysis is None or _refreshed(statuses):
+            fresh_analysis = self._process_with_ai(vehicle)
+            logger.info("AI analysis for %s: %s", vrm, _Payload(fresh_analysis))
+            if fresh_analysis:
+                self._store_ai_analysis(vrm, fresh_analysis)
+                ai_analysis = fresh_analysis
+            elif ai_analysis is not None:
+                logger.error(f"AI analysis failed for {vrm}; returning the stored report")
         else:
-            logger.warning(f"get_carly_vehicle_history did not return a dict for {vrm}")
-
-        if 'vin' in vehicle_data:
-            logger.info(f"Calling get_total_car_check for {vrm} with VIN: {vehicle_data['vin']}")
-            total_car_check_data = get_total_car_check(vrm, vehicle_data['vin'])
-            if isinstance(total_car_check_data, dict):
-                vehicle_data.update(total_car_check_data)
-                logger.info(f"Total car check data for {vrm}: {json.dumps(total_car_check_data)}")
-            else:
-                logger.warning(f"get_total_car_check did not return a dict for {vrm}")
+            logger.info(f"No source refreshed for {vrm}; reusing the stored AI analysis")
+
+        return {'vrm': vrm, 'profile': profile, 'vehicle_data': vehicle_model_dict(vehicle), 'sources': statuses, 'ai_analysis': ai_analysis}
+
+    def _get_cached_vehicle_data(self, vrm, profile):
+        """Answer from the stored record and, if any of it is stale, refresh it in the background.
+
+        The result has the usual keys plus 'cached': True, 'age' (seconds since
+        the record was last updated), 'ai_age' and 'revalidating'. Only the
+        profile's sources count towards staleness. Returns None when nothing is
+        stored yet.
+        """
+        record = self.db.readReg(vrm)
+        if not record:
+            return None
+
+        meta = self._read_meta(vrm)
+        stored = {**latest_values(record), **meta}
+        now = datetime.now()
+        statuses = {}
+        for source in self.pipeline.select(profile):
+            age = source.age(stored, now)
+            status = 'cached' if source.is_fresh(age) else 'stale'
+            statuses[source.name] = {'status': status, 'age': round(age) if age is not None else None, 'latency': 0}
+
+        ai_analysis = meta.get(AI_FIELD)
+        revalidating = ai_analysis is None or any(status['status'] == 'stale' for status in statuses.values())
+        if revalidating:
+            self._schedule_refresh(vrm, profile)
+
+        logger.info(f"Serving stored data for {vrm} (revalidating: {revalidating})")
+        return {
+            'vrm': vrm,
+            'profile': profile,
+            'vehicle_data': vehicle_model_dict(build_vehicle_model(stored)),
+            'sources': statuses,
+            'ai_analysis': ai_analysis,
+            'cached': True,
+            'age': _age_seconds(stored.get('updated_at'), now),
+            'ai_age': _age_seconds(meta.get(AI_AT_FIELD), now) if ai_analysis is not None else None,
+            'revalidating': revalidating,
+        }
+
+    def _schedule_refresh(self, vrm, profile):
+        # One background refresh per VRM and profile at a time; later callers keep getting the stored copy
+        with self.refresh_lock:
+            if (vrm, profile) in self.refreshing:
+                return
+            self.refreshing.add((vrm, profile))
+        self.refresh_executor.submit(self._refresh, vrm, profile)
+
+    def _refresh(self, vrm, profile):
+        try:
+            # Joins a foreground lookup of the same plate if one is already running
+            self.lookups.do((vrm, profile), self._lookup, vrm, profile)
+            logger.info(f"Background refresh complete for {vrm}")
+        except Exception as e:
+            logger.error(f"Background refresh failed for {vrm}: {str(e)}")
+        finally:
+            with self.refresh_lock:
+                self.refreshing.discard((vrm, profile))
+
+    def _read_meta(self, vrm):
+        # Latest AI report and fetch markers only; each is a single overwritten value
+        fields = [AI_FIELD, AI_AT_FIELD, *(source.marker for source in self.pipeline.registry.values())]
+        return self.meta.read_fields(vrm, fields, latest_only=True) or {}
+
+    def _store_ai_analysis(self, vrm, ai_analysis):
+        if ai_analysis:
+            self.meta.put(vrm, {AI_FIELD: ai_analysis, AI_AT_FIELD: datetime.now().isoformat()})
+
+    def get_vehicle_data_batch(self, vrms, max_workers=DEFAULT_BATCH_WORKERS, profile=None):
+        """Look up many VRMs with at most max_workers in flight, yielding results as they complete.
+
+        Repeated plates (ignoring case and spacing) are looked up once, and entries
+        that are not plates are rejected up front. Each yielded entry is
+        {'vrm', 'result' or 'error', 'elapsed'} with elapsed in seconds.
+        """
+        profile = self._profile(profile)
+        unique_vrms = {}
+        for vrm in vrms:
+            if not vrm.strip():
+                continue
+            try:
+                unique_vrms.setdefault(normalise_vrm(vrm), vrm)
+            except InvalidVRM as e:
+                yield {'vrm': vrm, 'error': str(e), 'elapsed': 0}
+        logger.info(f"Processing batch of {len(unique_vrms)} unique VRMs ({len(vrms)} submitted)")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._timed_lookup, vrm, profile) for vrm in unique_vrms]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _timed_lookup(self, vrm, profile=None):
+        started = time.monotonic()
+        try:
+            result = self.get_vehicle_data(vrm, profile)
+            entry = {'vrm': vrm, 'result': result} if result is not None else {'vrm': vrm, 'error': f"No data found for VRM: {vrm}"}
+        except Exception as e:
+            logger.error(f"Error looking up {vrm}: {str(e)}")
+            entry = {'vrm': vrm, 'error': str(e)}
+        entry['elapsed'] = round(time.monotonic() - started, 3)
+        return entry
+
+    def stream_vehicle_data(self, vrm, profile=None):
+        """Yield each source's data as soon as it lands, then the AI report chunk by chunk.
+
+        Events are dicts: {'event': 'source', 'source': name, 'data': {...}} per source,
+        {'event': 'ai', 'text': chunk} per report chunk and a final {'event': 'done'}
+        carrying the per-source status map. If the report fails partway the stream
+        ends with {'event': 'error'} instead, and the partial report is not stored.
+        """
+        vrm = normalise_vrm(vrm)
+        profile = self._profile(profile)
+        deadline = self._deadline()
+        combined_data, statuses, meta = yield from self._iter_combined_data(vrm, profile, deadline)
+
+        if meta.get(AI_FIELD) is not None and not _refreshed(statuses):
+            logger.info(f"No source refreshed for {vrm}; reusing the stored AI analysis")
+            yield {'event': 'ai', 'vrm': vrm, 'text': meta[AI_FIELD]}
         else:
-            logger.warning(f"VIN not found for {vrm}, skipping get_total_car_check")
-
-        # if 'make' in vehicle_data and 'model' in vehicle_data and 'year' in vehicle_data:
-        #     logger.info(f"Calling get_autotrader_listings for {vrm}")
-        #     autotrader_listings = get_autotrader_listings(vrm, vehicle_data['make'], vehicle_data['model'], vehicle_data['year'])
-        #     if isinstance(autotrader_listings, dict):
-        #         vehicle_data.update(autotrader_listings)
-        #         logger.info(f"AutoTrader listings for {vrm}: {json.dumps(autotrader_listings)}")
-        #     else:
-        #         logger.warning(f"get_autotrader_listings did not return a dict for {vrm}")
-        # else:
-        #     logger.warning(f"Missing make, model, or year for {vrm}, skipping get_autotrader_listings")
-
-        return vehicle_data
-    
-    def _process_with_ai(self, data):
+            logger.info("Streaming data through AI")
+            chunks = []
+            vehicle = build_vehicle_model(latest_values(combined_data))
+            try:
+                for chunk in self.ai.stream_input(_prompt_input(vehicle), timeout=self.ai_timeout):
+                    chunks.append(chunk)
+                    yield {'event': 'ai', 'vrm': vrm, 'text': chunk}
+            except Exception as e:
+                logger.error(f"AI stream for {vrm} failed after {len(chunks)} chunks: {str(e)}")
+                yield {'event': 'error', 'vrm': vrm, 'error': f"AI analysis failed: {str(e)}", 'sources': statuses}
+                return
+            self._store_ai_analysis(vrm, ''.join(chunks))
+
+        yield {'event': 'done', 'vrm': vrm, 'profile': profile, 'sources': statuses}
+
+    def _iter_combined_data(self, vrm, profile=None, deadline=None):
+        logger.info(f"Processing VRM: {vrm}")
+        # Records written before the meta store may still carry a report; it is not vehicle data
+        existing_data = {key: value for key, value in (self.db.readReg(vrm) or {}).items() if key != AI_FIELD}
+        meta = self._read_meta(vrm)
+        logger.info("Existing data for %s: %s", vrm, _Payload(existing_data))
+        if existing_data:
+            yield _source_event(vrm, 'database', existing_data)
+
+        # Only the profile's sources whose stored result has outlived its TTL go upstream
+        sources = self.pipeline.select(profile or self.profile)
+        stored = {**latest_values(existing_data), **meta}
+        now = datetime.now()
+        ages = {source.name: source.age(stored, now) for source in sources}
+        stale_sources = [source for source in sources if not source.is_fresh(ages[source.name])]
+        logger.info(f"Refreshing {[source.name for source in stale_sources]} for {vrm}")
+
+        results, statuses = yield from self._iter_source_data(vrm, stale_sources, self.pipeline.extract(stored), deadline)
+        for source in sources:
+            if source not in stale_sources:
+                statuses[source.name] = {'status': 'cached', 'age': round(ages[source.name]), 'latency': 0}
+
+        fetched_data = self.pipeline.merge(results, stale_sources)
+        if results:
+            fetched_at = datetime.now().isoformat()
+            markers = {source.marker: fetched_at for source in stale_sources if source.name in results}
+            if fetched_data:
+                self.db.write(vrm, fetched_data)
+            self.meta.put(vrm, markers)
+            logger.info(f"Wrote {list(results)} to DB for {vrm}")
+
+        combined_data = {**existing_data, **fetched_data}
+        logger.info("Combined data for %s: %s", vrm, _Payload(combined_data))
+        return combined_data, statuses, meta
+
+    def _iter_source_data(self, vrm, sources=None, known=None, deadline=None):
+        # Runs the source pipeline, turning each result into a stream event as it lands
+        deadline = deadline or self._deadline()
+        run = self.pipeline.run({**(known or {}), 'vrm': vrm}, self.clients, sources, deadline)
+        while True:
+            try:
+                name, data = next(run)
+            except StopIteration as stop:
+                return stop.value
+            logger.info("%s data for %s: %s", name, vrm, _Payload(data))
+            yield _source_event(vrm, name, data)
+
+    def _process_with_ai(self, vehicle):
         logger.info("Processing data with AI")
-        res = self.ai.process_input(str(data))
-        logger.info(f"AI processing complete. Result: {json.dumps(res)}")
+        res = self.ai.process_input(_prompt_input(vehicle), timeout=self.ai_timeout)
+        logger.info("AI processing complete. Result: %s", _Payload(res))
         return res
 
+def _refreshed(statuses):
+    # Whether any source brought back new data in this lookup
+    return any(status['status'] == 'ok' for status in statuses.values())
+
+def _age_seconds(timestamp, now):
+    try:
+        return round((now - datetime.fromisoformat(timestamp)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _prompt_input(vehicle):
+    # Only the canonical fields that are actually known go to the model
+    return str(vehicle_model_dict(vehicle, drop_empty=True))
+
+class _Payload:
+    """Describes a logged payload only when a handler actually formats the record.
+
+    Renders as a short summary (key count or length) at INFO and as a full JSON
+    dump only when the logger is at DEBUG, so a discarded record costs nothing.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        if logger.isEnabledFor(logging.DEBUG):
+            return json.dumps(self.data, default=str)
+        if isinstance(self.data, dict):
+            return f"{{{len(self.data)} keys}}"
+        if isinstance(self.data, (list, tuple)):
+            return f"[{len(self.data)} items]"
+        if isinstance(self.data, str):
+            return f"<{len(self.data)} chars>"
+        return repr(self.data)
+
+def _source_event(vrm, source, data):
+    return {'event': 'source', 'vrm': vrm, 'source': source, 'data': data}
+
+def _run_to_completion(generator):
+    # Drains a generator built with `yield from` and hands back its return value
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Fetch vehicle data for a given registration number.")
     parser.add_argument("vrm", help="Vehicle Registration Number")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE, help="Sources to run: fast, standard or full")
     args = parser.parse_args()
 
     logger.info(f"Starting vehicle data fetch for VRM: {args.vrm}")
 
-    database = Database()
-    interface = VehicleDataInterface(database)
+    database = get_database()
+    interface = VehicleDataInterface(database, profile=args.profile)
 
     vehicle_data = interface.get_vehicle_data(args.vrm)
     
@@ -0,0 +1,247 @@
+import json
+import asyncio
+import argparse
+from urllib.parse import unquote, urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from interface import VehicleDataInterface, DEFAULT_DEADLINE, DEFAULT_AI_TIMEOUT
+from Utils.database import get_database
+from Utils.vrm import normalise_vrm, InvalidVRM
+from Utils.pipeline import PROFILES, DEFAULT_PROFILE
+from Utils.logging import logger
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_CONCURRENCY = 8
+KEEP_ALIVE_TIMEOUT = 15
+MAX_BODY_SIZE = 1024 * 1024
+MAX_BATCH_SIZE = 500
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class VehicleDataServer:
+    """HTTP/JSON front-end for VehicleDataInterface.
+
+    GET /vehicle/{vrm} answers with a single JSON document, and GET
+    /vehicle/{vrm}/stream sends the same lookup as Server-Sent Events: one event
+    per source as it lands, then the AI report chunk by chunk. POST /vehicles takes
+    {"vrms": [...]} and streams one JSON line per distinct VRM, in completion order,
+    over a chunked response; entries that are not plates come first as errors.
+    Lookups are blocking, so they run on a thread pool and at most `concurrency`
+    of them are in flight across all connections.
+
+    Lookups accept a profile (?profile=fast on the GET routes, "profile" in the
+    batch body) choosing which sources run; GET /sources lists them.
+    """
+
+    def __init__(self, interface, concurrency=DEFAULT_CONCURRENCY):
+        self.interface = interface
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='http-lookup')
+        self.semaphore = None
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.write(f"Vehicle data API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    await self.route(method, path, query, body, writer, keep_alive)
+                except HTTPError as e:
+                    await self.send_json(writer, e.status, {'error': str(e)}, keep_alive)
+        except HTTPError as e:
+            await self.send_json(writer, e.status, {'error': str(e)}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.write(f"Error in handle_connection: {str(e)}", is_exception=True)
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return method.upper(), url.path, parse_qs(url.query), headers, body
+
+    async def route(self, method, path, query, body, writer, keep_alive):
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+
+        if parts == ['health'] and method == 'GET':
+            await self.send_json(writer, HTTPStatus.OK, {'status': 'ok'}, keep_alive)
+        elif parts == ['sources'] and method == 'GET':
+            sources = {'profiles': PROFILES, 'sources': self.interface.pipeline.describe()}
+            await self.send_json(writer, HTTPStatus.OK, sources, keep_alive)
+        elif len(parts) == 2 and parts[0] == 'vehicle' and method == 'GET':
+            vrm = self.parse_vrm(parts[1])
+            result = await self.lookup(vrm, self.parse_profile(query.get('profile', [None])[0]))
+            status = HTTPStatus.OK if 'error' not in result else HTTPStatus.BAD_GATEWAY
+            await self.send_json(writer, status, result, keep_alive)
+        elif len(parts) == 3 and parts[0] == 'vehicle' and parts[2] == 'stream' and method == 'GET':
+            profile = self.parse_profile(query.get('profile', [None])[0])
+            await self.stream_vehicle(writer, self.parse_vrm(parts[1]), profile, keep_alive)
+        elif parts == ['vehicles'] and method == 'POST':
+            vrms, rejected, profile = self.parse_batch(body)
+            await self.stream_batch(writer, vrms, rejected, profile, keep_alive)
+        elif parts[0] in ('health', 'sources', 'vehicle', 'vehicles'):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {path}")
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {path}")
+
+    def parse_vrm(self, vrm):
+        try:
+            return normalise_vrm(vrm)
+        except InvalidVRM as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+
+    def parse_profile(self, profile):
+        # None leaves the choice to the interface's default profile
+        if profile is not None and profile not in PROFILES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown profile {profile!r}, expected one of {', '.join(PROFILES)}")
+        return profile
+
+    def parse_batch(self, body):
+        """Returns (vrms, rejected, profile): the distinct normalised plates, and an error entry per input that is not one."""
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        vrms = payload.get('vrms') if isinstance(payload, dict) else payload
+        if not isinstance(vrms, list) or not all(isinstance(vrm, str) for vrm in vrms):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected {\"vrms\": [\"...\"]}")
+        if len(vrms) > MAX_BATCH_SIZE:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BATCH_SIZE} VRMs per batch")
+        profile = self.parse_profile(payload.get('profile') if isinstance(payload, dict) else None)
+
+        unique_vrms = {}
+        rejected = []
+        for vrm in vrms:
+            try:
+                unique_vrms.setdefault(normalise_vrm(vrm), vrm)
+            except InvalidVRM as e:
+                rejected.append({'vrm': vrm, 'error': str(e)})
+        return list(unique_vrms), rejected, profile
+
+    async def lookup(self, vrm, profile=None):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self.executor, self.interface.get_vehicle_data, vrm, profile)
+            except Exception as e:
+                logger.write(f"Error in lookup for VRM {vrm}: {str(e)}", is_exception=True)
+                return {'vrm': vrm, 'error': str(e)}
+        if result is None:
+            return {'vrm': vrm, 'error': f"No data found for VRM: {vrm}"}
+        return {'vrm': vrm, 'result': result}
+
+    async def stream_batch(self, writer, vrms, rejected, profile, keep_alive):
+        await self.send_head(writer, HTTPStatus.OK, 'application/x-ndjson', keep_alive, chunked=True)
+        for entry in rejected:
+            await self.send_chunk(writer, json.dumps(entry).encode('utf-8') + b'\n')
+        for lookup in asyncio.as_completed([self.lookup(vrm, profile) for vrm in vrms]):
+            await self.send_chunk(writer, json.dumps(await lookup).encode('utf-8') + b'\n')
+        await self.send_chunk(writer, b'')
+
+    async def stream_vehicle(self, writer, vrm, profile, keep_alive):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            events = self.interface.stream_vehicle_data(vrm, profile)
+            await self.send_head(writer, HTTPStatus.OK, 'text/event-stream', keep_alive, chunked=True)
+            while True:
+                try:
+                    event = await loop.run_in_executor(self.executor, next, events, None)
+                except Exception as e:
+                    logger.write(f"Error in stream_vehicle for VRM {vrm}: {str(e)}", is_exception=True)
+                    event = {'event': 'error', 'vrm': vrm, 'error': str(e)}
+                if event is None:
+                    break
+                await self.send_chunk(writer, f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+                if event['event'] == 'error':
+                    break
+        await self.send_chunk(writer, b'')
+
+    async def send_chunk(self, writer, data):
+        # An empty chunk terminates the chunked body
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+        await writer.drain()
+
+    async def send_head(self, writer, status, content_type, keep_alive, length=None, chunked=False):
+        status = HTTPStatus(status)
+        head = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if chunked:
+            head.append("Transfer-Encoding: chunked")
+        else:
+            head.append(f"Content-Length: {length}")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+    async def send_json(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        await self.send_head(writer, status, 'application/json', keep_alive, length=len(body))
+        writer.write(body)
+        await writer.drain()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vehicle Data HTTP API")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to bind")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to bind")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum lookups in flight")
+    parser.add_argument("--swr", action="store_true", help="Answer repeat lookups from stored data and refresh it in the background")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE, help="Sources a lookup runs unless the request picks a profile")
+    parser.add_argument("--disable", action="append", default=[], metavar="SOURCE", help="Switch off a source by name (repeatable)")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE, help="Seconds a lookup waits for its sources (0 for no limit)")
+    parser.add_argument("--ai-timeout", type=float, default=DEFAULT_AI_TIMEOUT, help="Seconds a lookup waits for the AI report (0 for no limit)")
+    args = parser.parse_args()
+
+    interface = VehicleDataInterface(get_database(), deadline=args.deadline, stale_while_revalidate=args.swr, profile=args.profile,
+                                     disabled_sources=args.disable, ai_timeout=args.ai_timeout)
+    server = VehicleDataServer(interface, args.concurrency)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Server stopped by user.")